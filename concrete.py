@@ -1,3 +1,5 @@
+import multiprocessing
+
 import pygame
 import const
 
@@ -7,8 +9,11 @@ import src.utils as utils
 import src.spites as sprites
 import src.sounds as sounds
 import src.colors as colors
+import src.cementfill as cementfill
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # for the worker processes, when running as an exe
+    cementfill.start_workers()  # before any other threads are started
     pygame.init()
     screen = utils.make_fancy_scaled_display(
         const.GAME_DIMS,
@@ -66,3 +71,6 @@ if __name__ == "__main__":
         pygame.display.flip()
 
         dt = clock.tick(60)
+
+    scene_manager.shutdown()
+    cementfill.stop_workers()
@@ -0,0 +1,168 @@
+import contextlib
+import io
+import random
+import time
+import timeit
+import tracemalloc
+
+import src.cementfill as cementfill
+import src.geometry as geometry
+import src.gameplay as gameplay
+import src.goals as goals
+import src.levels as levels
+import src.utils as utils
+
+# Rough performance measurements for the hot paths. Run from the project root with: python -m src.benchmarks
+
+
+def measure(func, n=100):
+    """returns: (avg milliseconds per call, avg peak KiB allocated per call)"""
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    ms = 1000 * (time.perf_counter() - start) / n
+
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(min(n, 20)):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        peak_total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return ms, peak_total / min(n, 20) / 1024
+
+
+def report(name, func, n=100):
+    ms, kib = measure(func, n=n)
+    print(f"{name:<32} {ms:>9.3f} ms {kib:>10.1f} KiB")
+
+
+def quietly(func):
+    def wrapped():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return wrapped
+
+
+def subdivided_board(style, size, seed=12345):
+    random.seed(seed)
+    board = gameplay.Board.new_board(style, size)
+    quietly(lambda: goals.PolygonGoalFactory.subdivide_board(board, goals.GoalGenParams()))()
+    return board
+
+
+def bench_render_polygons(board):
+    """The polygon transforms done while drawing a frame's regions."""
+    polys = board.calc_polygons()
+
+    def run():
+        for p in polys:
+            screen_poly = p.scale(300, from_center=False).shift((50, 50))
+            screen_poly.expand_from_center(2)
+            screen_poly.pizza_cut(screen_poly.avg_pt())
+            p.normalize((0, 0, 48, 48))
+    return run
+
+
+def bench_generator_attempt(board):
+    """One attempt by the goal generator to find new shapes."""
+    gen = goals.GoalGenerator(board, goals.GoalGenParams())
+
+    def run():
+        gen.board.clear_user_edges(force=True)
+        goals.PolygonGoalFactory.subdivide_board(gen.board, gen.params)
+        for p in gen.board.calc_polygons():
+            gen.params.accepts(p.normalize())
+    return quietly(run)
+
+
+def bench_copy_board(board):
+    def run():
+        board.copy()
+    return run
+
+
+def bench_start_fills(board, use_cache):
+    """Creating the fill animation of every region on the board, at roughly the size they're drawn in game."""
+    polys = [p.scale(200, from_center=False) for p in board.calc_polygons()]
+
+    def run():
+        for p in polys:
+            cementfill.Filler(p, utils.bounding_box(p.vertices), use_cache=use_cache)
+    return run
+
+
+def edge_hash_collisions(board):
+    """returns: (number of candidate edges, number of distinct hashes among them)"""
+    pegs = list(board.pegs)
+    edges = [geometry.Edge(pegs[i], pegs[j]) for i in range(len(pegs)) for j in range(i + 1, len(pegs))]
+    return len(edges), len(set(hash(e) for e in edges))
+
+
+def micro_kernels(n=100000):
+    """Per-call cost of the generic utils functions vs. the 2D kernels that Edge uses."""
+    p, a, b, c = (0.3, 0.7), (0.1, 0.2), (0.9, 0.8), (0.2, 0.9)
+    cases = [
+        ("dist to segment",
+         lambda: utils.dist_from_point_to_line(p, a, b, segment=True),
+         lambda: utils.dist_to_segment_xy(p[0], p[1], a[0], a[1], b[0], b[1])),
+        ("line-line intersection",
+         lambda: utils.line_line_intersection(a, b, p, c),
+         lambda: utils.line_line_intersection_xy(a[0], a[1], b[0], b[1], p[0], p[1], c[0], c[1])),
+        ("dist",
+         lambda: utils.dist(a, b),
+         lambda: utils.dist_xy(a[0], a[1], b[0], b[1])),
+    ]
+    for name, generic, kernel in cases:
+        t_generic = min(timeit.repeat(generic, number=n, repeat=3)) / n * 1e9
+        t_kernel = min(timeit.repeat(kernel, number=n, repeat=3)) / n * 1e9
+        print(f"{name:<32} {t_generic:>7.0f} ns -> {t_kernel:>5.0f} ns ({t_generic / t_kernel:.1f}x)")
+
+
+def bench_samplers(level_idx, seconds=1.0):
+    """Accepted (and distinct accepted) shapes per second for each of the goal generator's samplers, and for
+        subdivision with tuned params (which starts from whatever the tuner saved last time).
+    """
+    level = levels.LEVELS[level_idx]
+    variants = [(sampler, False) for sampler in goals.GoalGenParams.SAMPLERS] + [("subdivide", True)]
+    for sampler, tuned in variants:
+        board = gameplay.Board.new_board(*level.style)
+        params = goals.GoalGenParams()
+        params.banned_polys.add(board.calc_polygons()[0])
+        params.banned_polys.add_all(level.banned_polys)
+        params.min_n_vertices = level.min_vertices
+        params.max_n_vertices = level.max_vertices
+        params.sampler = sampler
+        gen = goals.GoalGenerator(board, params, tune_params=tuned)
+
+        accepted = 0
+        distinct = geometry.ShapeIndex()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            while time.perf_counter() - start < seconds:
+                goal = gen.gen_next_goal(max_tries=1)
+                if goal is not None:
+                    accepted += 1
+                    distinct.add(goal.polygon)
+        elapsed = time.perf_counter() - start
+        name = sampler + (" (tuned)" if tuned else "")
+        print(f"level {level_idx:>2} {str(level.style):<16} {name:<17} "
+              f"{accepted / elapsed:>8.1f} shapes/s ({len(distinct) / elapsed:.1f} distinct/s)")
+
+
+if __name__ == "__main__":
+    cementfill.Filler.set_cache_size(64)  # enough for every region of every board below, so repeats always hit
+    micro_kernels()
+    for idx in (0, 5, 6, 7):
+        bench_samplers(idx)
+    for style, size in [("SQUARE", 4), ("RECT", (5, 5)), ("HEX", (5, 5))]:
+        board = subdivided_board(style, size)
+        n_edges, n_hashes = edge_hash_collisions(board)
+        print(f"{style} {size}: {len(board.pegs)} pegs, {n_hashes}/{n_edges} distinct edge hashes")
+        report("  render polygons", bench_render_polygons(board), n=200)
+        report("  generator attempt", bench_generator_attempt(board), n=50)
+        report("  copy board", bench_copy_board(board), n=200)
+        report("  start fills (uncached)", bench_start_fills(board, False), n=10)
+        report("  start fills (cached)", bench_start_fills(board, True), n=10)
+    print(f"fill cache: {cementfill.Filler.get_cache()}")
@@ -1,3 +1,6 @@
+import concurrent.futures
+import multiprocessing
+import multiprocessing.shared_memory
 import random
 
 import pygame
@@ -7,8 +10,148 @@ import src.colors as colors
 import collections
 import src.utils as utils
 
+
+def calc_pour_order(inside, starts, kernel, n_colors, rng):
+    """Simulates a whole pour up front, as a breadth-first search out from the starting cells. The cells in each wave
+    are visited in a random order, and each one fills its unfilled neighbors (within the kernel), which copy its color
+    half of the time and get a random one otherwise.
+        inside: (width, height) bool array of the cells that can be filled
+        starts: (x, y) of each starting cell
+        rng: numpy Generator
+        returns: (xs, ys, colors) arrays of the filled cells, in the order they're poured. colors are palette indices.
+    """
+    np = geometry.np
+    w, h = inside.shape
+
+    # works on flat indices into a grid with a border as wide as the kernel, so neighbors never go out of bounds
+    pad = max(max(abs(k[0]), abs(k[1])) for k in kernel)
+    grid_h = h + 2 * pad
+    unfilled = np.zeros((w + 2 * pad, grid_h), dtype=bool)
+    unfilled[pad:pad + w, pad:pad + h] = inside
+    unfilled = unfilled.ravel()
+    claims = np.empty(len(unfilled), dtype=np.int32)
+    offsets = np.array([kx * grid_h + ky for (kx, ky) in kernel], dtype=np.int32)
+
+    idxs = np.array([(x + pad) * grid_h + y + pad for (x, y) in starts], dtype=np.int32)
+    cs = rng.integers(n_colors, size=len(starts)).astype(np.uint8)
+    unfilled[idxs] = False
+    waves = [(idxs, cs)]
+
+    while len(idxs) > 0:
+        perm = rng.permutation(len(idxs))
+        neighbors = (idxs[perm, None] + offsets).ravel()
+        keep = unfilled[neighbors]
+        neighbors = neighbors[keep]
+        parent_cs = np.repeat(cs[perm], len(offsets))[keep]
+
+        # a cell next to several of the wave's cells goes to whichever got to it first
+        order = np.arange(len(neighbors), dtype=np.int32)
+        claims[neighbors] = len(neighbors)
+        np.minimum.at(claims, neighbors, order)
+        first = order[claims[neighbors] == order]
+
+        idxs = neighbors[first]
+        cs = np.where(rng.random(len(first)) < 0.5, parent_cs[first], rng.integers(n_colors, size=len(first)))
+        cs = cs.astype(np.uint8)
+        unfilled[idxs] = False
+        waves.append((idxs, cs))
+
+    idxs = np.concatenate([wave[0] for wave in waves])
+    xs, ys = np.divmod(idxs, grid_h)
+    res = ((xs - pad).astype(np.int16), (ys - pad).astype(np.int16), np.concatenate([wave[1] for wave in waves]))
+    for arr in res:
+        arr.flags.writeable = False  # can be shared between Fillers
+    return res
+
+
+_POOL = None  # process pool for big pours, started when first needed
+
+
+def _get_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        # spawned rather than forked, since a fork could copy a lock that another thread (e.g. the goal worker, or
+        # SDL's audio thread) is holding, and deadlock
+        _POOL = concurrent.futures.ProcessPoolExecutor(max_workers=Filler.WORKERS,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+    return _POOL
+
+
+def start_workers():
+    """Starts the worker processes for big pours ahead of time, since that takes a moment."""
+    if geometry.np is not None and Filler.ASYNC_MIN_CELLS > 0:
+        _get_pool().submit(int)
+
+
+def stop_workers():
+    """Shuts down the worker processes, dropping any pours they haven't started."""
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=True, cancel_futures=True)
+        _POOL = None
+
+
+def _shared_pour_arrays(buf, n, capacity):
+    """returns: (xs, ys, colors) arrays of length n, as views of buf, which has room for capacity cells."""
+    np = geometry.np
+    return (np.ndarray((n,), dtype=np.int16, buffer=buf, offset=0),
+            np.ndarray((n,), dtype=np.int16, buffer=buf, offset=2 * capacity),
+            np.ndarray((n,), dtype=np.uint8, buffer=buf, offset=4 * capacity))
+
+
+def _calc_pour_into_shared_memory(shm_name, capacity, inside, starts, kernel, n_colors, seed):
+    """Runs in a worker process. Does calc_pour_order, and writes the result into the named shared memory.
+        returns: number of cells in the pour
+    """
+    np = geometry.np
+    shm = multiprocessing.shared_memory.SharedMemory(name=shm_name)
+    try:
+        pour = calc_pour_order(inside, starts, kernel, n_colors, np.random.default_rng(seed))
+        views = _shared_pour_arrays(shm.buf, len(pour[0]), capacity)
+        for (view, arr) in zip(views, pour):
+            view[:] = arr
+        del views, view  # the memory can't be closed while they're around
+        return len(pour[0])
+    finally:
+        shm.close()
+
+
+class SharedPour:
+    """A pour order that was calculated by a worker process. Its arrays are views of the shared memory it was written
+    to, which stays mapped for as long as this is around. Can be used like the (xs, ys, colors) tuple.
+    """
+
+    __slots__ = ('arrays', 'shm')  # arrays comes first, so they're let go of before the memory is closed
+
+    def __init__(self, shm, n, capacity):
+        self.arrays = _shared_pour_arrays(shm.buf, n, capacity)
+        for arr in self.arrays:
+            arr.flags.writeable = False
+        self.shm = shm
+
+    def __getitem__(self, idx):
+        return self.arrays[idx]
+
+    def __iter__(self):
+        return iter(self.arrays)
+
+    def __len__(self):
+        return len(self.arrays)
+
+
 class Filler:
 
+    EMPTY = 255  # palette index of unfilled pixels, which is the colorkey
+
+    CACHE_SIZE = 32  # how many shapes' pours to remember (use set_cache_size to change it)
+    CACHE_QUANTUM = 0.01  # px, screen polygons within this of each other share a pour
+    _CACHE = None  # key (see cache_key) -> pour_order, created when first needed
+
+    # pours at least this big are calculated in a worker process (0 to never do that). Below it, calculating in-thread
+    # takes less than ~4ms, which is about what setting up the shared memory and submitting can cost
+    ASYNC_MIN_CELLS = 5000
+    WORKERS = 1
+
     def __init__(
             self,
             polygon: geometry.Polygon,
@@ -18,44 +161,118 @@ class Filler:
             fill_time_pcnt=0.25,
             max_brightness=0.3,
             final_brightness=0.4,
-            n_starts=1):
-
-        self.paint_surf = pygame.Surface((rect[2], rect[3]), pygame.SRCALPHA)
-
-        self.mask_surf = pygame.Surface((rect[2], rect[3]))
-        self.mask_surf.fill("white")
-        pygame.draw.polygon(self.mask_surf, "black", polygon.shift((-rect[0], -rect[1])).vertices, width=0)
+            n_starts=1,
+            precompute=None,
+            use_cache=True):
+        """precompute: whether to work out the whole pour in advance (needs numpy, which is the default if it's
+                available). Otherwise the pour is simulated a little at a time in update().
+            use_cache: whether to reuse the precomputed pour of an earlier Filler with the same shape (recolored).
+        """
+        if precompute is None:
+            precompute = geometry.np is not None
+
+        # 8-bit surface whose pixels are indices into palette, so drying is done by just changing the palette
+        self.paint_surf = pygame.Surface((rect[2], rect[3]), depth=8)
+        self.paint_surf.set_palette_at(Filler.EMPTY, (0, 0, 0))
+        self.paint_surf.set_colorkey(Filler.EMPTY)
+        self.paint_surf.fill(Filler.EMPTY)
+
+        self.size = self.paint_surf.get_size()
+        self.palette = [pygame.Color(c) for c in palette]
+        self.kernel = self._get_kernel(3)
 
-        self.size = self.mask_surf.get_size()
+        self.edge_cells = collections.deque()
+        self.remaining_cells = None
+        self.pour_order = None  # (xs, ys, colors) if precomputed
+        self.pour_start_time = 0  # when the precomputed pour started
+
+        self._pending = None  # (future, shm, capacity, cache_key, args) of a pour being calculated in a worker process
+        cache_key = None
+        if precompute and use_cache:
+            cache_key = Filler.cache_key(polygon, rect, len(self.palette), n_starts)
+            self.pour_order = Filler.get_cache().get(cache_key)
+            if self.pour_order is not None and len(self.palette) > 1:
+                # same pour as before, so rotate the palette to make it look different
+                k = random.randrange(1, len(self.palette))
+                self.palette = self.palette[k:] + self.palette[:k]
+
+        if self.pour_order is None:
+            # 8-bit surface, so each pixel's byte is 1 inside the polygon and 0 outside
+            mask_surf = pygame.Surface(self.size, depth=8)
+            mask_surf.fill(0)
+            pygame.draw.polygon(mask_surf, 1, polygon.shift((-rect[0], -rect[1])).vertices, width=0)
+
+            # (y * width + x) -> 1 if that cell is inside the polygon and hasn't been filled yet, else 0
+            self.remaining_cells = bytearray(pygame.image.tobytes(mask_surf, "P"))
+            n_remaining = self.remaining_cells.count(1)
+
+            starts = []
+            for _ in range(min(n_starts, n_remaining)):
+                xy = self._random_remaining_cell()
+                starts.append(xy)
+                self.remaining_cells[xy[1] * self.size[0] + xy[0]] = 0
+
+            if precompute:
+                np = geometry.np
+                inside = np.frombuffer(self.remaining_cells, dtype=np.uint8).reshape(self.size[1], self.size[0]).T > 0
+                seed = random.getrandbits(64)
+                if 0 < Filler.ASYNC_MIN_CELLS <= n_remaining and \
+                        self._submit_pour(inside, starts, seed, n_remaining, cache_key):
+                    # too slow to do here. Nothing is poured until the worker process is done, which takes about as
+                    # long as it would here (a frame or two), and then the pour speeds up to finish on time
+                    n_to_fill = n_remaining
+                else:
+                    self._calc_pour(inside, starts, seed, cache_key)
+
+            if not precompute:
+                for xy in starts:
+                    self.edge_cells.appendleft(xy)
+                    self._fill_cell(xy)
+                n_to_fill = n_remaining - len(starts)
+
+        if self.pour_order is not None:
+            n_to_fill = len(self.pour_order[0])
 
-        self.palette = palette
         self.max_brightness = max_brightness
         self.final_brightness = final_brightness
 
-        self.remaining_cells = set()
-        for x in range(0, self.size[0]):
-            for y in range(0, self.size[1]):
-                px = self.mask_surf.get_at((x, y))
-                if px == (0, 0, 0):
-                    self.remaining_cells.add((x, y))
-
-        self.edge_cells = collections.deque()
-        starters = random.sample(list(self.remaining_cells), k=min(n_starts, len(self.remaining_cells)))
-        for xy in starters:
-            self.edge_cells.appendleft(xy)
-            self._fill_cell(xy)
-            self.remaining_cells.remove(xy)
+        # what each color becomes when fully dry (before scaling by brightness)
+        white = pygame.Color(colors.WHITE)
+        self.dry_palette = [pygame.Color(*(min(255, w * c // 255 + w) for (w, c) in zip(white[:3], color[:3])))
+                            for color in self.palette]
+        self.brightness = None
+        self._set_brightness(0)
 
         self.has_filled = 0
         self.elapsed_time = 0
-        total_fill_time = fill_time_pcnt * total_time
-        self.px_per_sec = len(self.remaining_cells) / total_fill_time
+        self.fill_time = fill_time_pcnt * total_time
+        self.px_per_sec = n_to_fill / self.fill_time
 
-        self.dry_time = total_time - total_fill_time
+        self.dry_time = total_time - self.fill_time
         self.dry_time_remaining = self.dry_time
-        self.drying_image = None
 
-        self.kernel = self._get_kernel(3)
+    @staticmethod
+    def get_cache() -> utils.LRUCache:
+        """returns: the cache of pours, which also has the hit and miss counts."""
+        if Filler._CACHE is None:
+            Filler._CACHE = utils.LRUCache(Filler.CACHE_SIZE)
+        return Filler._CACHE
+
+    @staticmethod
+    def set_cache_size(max_size):
+        """Changes how many shapes' pours are remembered, dropping the least recently used ones if it's shrinking."""
+        Filler.CACHE_SIZE = max_size
+        if Filler._CACHE is not None:
+            Filler._CACHE.set_max_size(max_size)
+
+    @staticmethod
+    def cache_key(polygon: geometry.Polygon, rect, n_colors, n_starts):
+        """returns: key for the pour of polygon in rect, which is the same wherever rect is on the screen."""
+        q = Filler.CACHE_QUANTUM
+        verts = [(round((x - rect[0]) / q), round((y - rect[1]) / q)) for (x, y) in polygon.vertices]
+        # the same outline can start at any vertex, and go either way around
+        verts = min(min(tuple(vs[i:] + vs[:i]) for i in range(len(vs))) for vs in (verts, verts[::-1]))
+        return (int(rect[2]), int(rect[3]), n_colors, n_starts, verts)
 
     def _get_kernel(self, radius):
         res = []
@@ -65,55 +282,144 @@ class Filler:
                     res.append((x, y))
         return res
 
+    def _random_remaining_cell(self, max_tries=1000):
+        w, h = self.size
+        for _ in range(max_tries):
+            x, y = random.randrange(w), random.randrange(h)
+            if self.remaining_cells[y * w + x]:
+                return x, y
+        idx = self.remaining_cells.index(1)  # very thin polygon, just take the first cell
+        return idx % w, idx // w
+
+    def _calc_pour(self, inside, starts, seed, cache_key):
+        np = geometry.np
+        self.pour_order = calc_pour_order(inside, starts, self.kernel, len(self.palette), np.random.default_rng(seed))
+        if cache_key is not None:
+            Filler.get_cache().put(cache_key, self.pour_order)
+
+    def _submit_pour(self, inside, starts, seed, capacity, cache_key):
+        """returns: whether the pour was submitted to a worker process."""
+        shm = multiprocessing.shared_memory.SharedMemory(create=True, size=5 * capacity)
+        try:
+            future = _get_pool().submit(_calc_pour_into_shared_memory, shm.name, capacity, inside, starts,
+                                        self.kernel, len(self.palette), seed)
+        except Exception as e:
+            print(f"WARN: couldn't start pour in worker process: {e}")
+            shm.close()
+            shm.unlink()
+            return False
+        # once the worker is done with it, nothing else needs to find the memory by name (even if this Filler is gone)
+        future.add_done_callback(lambda _: shm.unlink())
+        self._pending = (future, shm, capacity, cache_key, (inside, starts, seed))
+        return True
+
+    def _receive_pour(self):
+        """Starts the pour from the worker process (or calculates it here, if that failed), fast enough to finish
+            by fill_time.
+        """
+        future, shm, capacity, cache_key, args = self._pending
+        self._pending = None
+        try:
+            n = future.result()
+        except Exception as e:
+            print(f"WARN: pour in worker process failed: {e}")
+            shm.close()
+            self._calc_pour(*args, cache_key)
+        else:
+            self.pour_order = SharedPour(shm, n, capacity)
+            if cache_key is not None:
+                Filler.get_cache().put(cache_key, self.pour_order)
+        self.pour_start_time = self.elapsed_time
+        self.px_per_sec = len(self.pour_order[0]) / max(0.001, self.fill_time - self.elapsed_time)
+
+    def _pour_to(self, n):
+        """Writes the precomputed pour's first n cells to paint_surf."""
+        n = min(n, len(self.pour_order[0]))
+        if n < self.has_filled:
+            self.paint_surf.fill(Filler.EMPTY)
+            self.has_filled = 0
+        if n == self.has_filled:
+            return
+        xs, ys, cs = (arr[self.has_filled:n] for arr in self.pour_order)
+        pixels = pygame.surfarray.pixels2d(self.paint_surf)
+        pixels[xs, ys] = cs
+        del pixels  # unlocks the surface
+        self.has_filled = n
+
+    def _set_brightness(self, brightness):
+        """Sets how far along each color is towards its dry color."""
+        if brightness != self.brightness:
+            self.paint_surf.set_palette([c.lerp(d, brightness) for (c, d) in zip(self.palette, self.dry_palette)])
+            self.brightness = brightness
+
+    def seek(self, elapsed_time):
+        """Jumps to how the fill looks after elapsed_time seconds. Only for precomputed pours (waits for the worker
+            process, if it's still calculating it).
+        """
+        if self._pending is not None:
+            self._receive_pour()
+            self.pour_start_time = 0
+            self.px_per_sec = len(self.pour_order[0]) / self.fill_time
+        self.elapsed_time = elapsed_time
+        self._pour_to(int(self.px_per_sec * (elapsed_time - self.pour_start_time)))
+        self.dry_time_remaining = self.dry_time - max(0.0, elapsed_time - self.fill_time)
+        self._set_brightness(self._dry_brightness())
+
     def update(self, dt):
         self.elapsed_time += dt / 1000
+        if self._pending is not None and self._pending[0].done():
+            self._receive_pour()
 
-        if not self.is_finished_pouring():
+        if self._pending is not None:
+            pass  # still waiting on the worker process
+
+        elif self.pour_order is not None and not self.is_finished_pouring():
+            self._pour_to(int(self.px_per_sec * (self.elapsed_time - self.pour_start_time)))
+
+        elif not self.is_finished_pouring():
             random.shuffle(self.edge_cells)
             need_to_fill = int(self.px_per_sec * self.elapsed_time) - self.has_filled
+            w, h = self.size
+            remaining = self.remaining_cells
             while need_to_fill > 0 and len(self.edge_cells) > 0:
                 next_xy = self.edge_cells.pop()
-                my_color = self.paint_surf.get_at(next_xy)  # should already be colored
+                my_color = self.paint_surf.get_at_mapped(next_xy)  # should already be colored
                 for k in self.kernel:
-                    neighbor = (next_xy[0] + k[0], next_xy[1] + k[1])
-                    if neighbor in self.remaining_cells:
-                        self._fill_cell(neighbor, my_color)
-                        self.edge_cells.appendleft(neighbor)
+                    x, y = next_xy[0] + k[0], next_xy[1] + k[1]
+                    if 0 <= x < w and 0 <= y < h and remaining[y * w + x]:
+                        self._fill_cell((x, y), my_color)
+                        self.edge_cells.appendleft((x, y))
                         need_to_fill -= 1
-                        self.remaining_cells.remove(neighbor)
+                        self.has_filled += 1
+                        remaining[y * w + x] = 0
 
         else:
-            if self.drying_image is None:
-                self.drying_image = pygame.Surface(self.paint_surf.get_size(), pygame.SRCALPHA)
-
-            prog = min(1.0, 1 - self.dry_time_remaining / self.dry_time)
-            self.drying_image.fill((0, 0, 0, 0))
-            self.drying_image.blit(self.paint_surf, (0, 0))
-            overlay = pygame.Surface(self.paint_surf.get_size(), pygame.SRCALPHA)
-            clr = pygame.Color(colors.WHITE)
-            clr.a = int(255 * prog * (self.max_brightness if prog < 1 else self.final_brightness))
-            overlay.fill(clr)
-            overlay.blit(self.paint_surf, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
-            overlay.fill(colors.WHITE, special_flags=pygame.BLEND_RGB_ADD)
-            self.drying_image.blit(overlay, (0, 0))
-
+            self._set_brightness(self._dry_brightness())
             self.dry_time_remaining -= dt / 1000
 
+    def _dry_brightness(self):
+        prog = min(1.0, 1 - self.dry_time_remaining / self.dry_time)
+        return prog * (self.max_brightness if prog < 1 else self.final_brightness)
+
     def _fill_cell(self, xy, from_color=None):
         if from_color is not None and random.random() < 0.5:
             color = from_color
         else:
-            color = random.choice(self.palette)
+            color = random.randrange(len(self.palette))
         self.paint_surf.set_at(xy, color)
 
     def is_finished_pouring(self):
+        if self._pending is not None:
+            return False
+        if self.pour_order is not None:
+            return self.has_filled >= len(self.pour_order[0])
         return len(self.edge_cells) == 0
 
     def is_finished(self):
         return self.is_finished_pouring() and self.dry_time_remaining <= 0
 
     def get_image(self):
-        return self.paint_surf if (not self.is_finished_pouring() or self.drying_image is None) else self.drying_image
+        return self.paint_surf
 
 
 if __name__ == "__main__":
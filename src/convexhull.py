@@ -11,70 +11,38 @@ def orientation(pivot, q, r) -> str:
     else:
         return 'cw' if val > 0 else 'ccw'
 
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
 def compute(
         points: typing.List[typing.Tuple[float, float]],
-        include_colinear_edge_points=False
+        include_colinear_edge_points=False,
+        thresh=0.0001
 ) -> typing.List[typing.Tuple[float, float]]:
-
+    """Andrew's monotone chain, O(n log n).
+        thresh: how far (perpendicular) a point can be from a hull edge and still count as being on it.
+        returns: the points on the hull, in order.
+    """
+    points = sorted(set(points))
     if len(points) < 3:
-        return list(points)
-
-    # XXX this method can like... deadlock depending on point order T_T
-    points = sorted(points, key=lambda xy: (xy[1], xy[0]))
-
-    res = []
-    leftmost_idx = min((idx for idx in range(len(points))), key=lambda _idx: points[_idx][0])
-    pivot_idx = leftmost_idx
-
-    while True:
-        res.append(pivot_idx)  # add current pivot to hull
-        next_idx = (pivot_idx + 1) % len(points)
-
-        # find next pivot
-        for i in range(len(points)):
-            ori = orientation(points[pivot_idx], points[i], points[next_idx])
-            if ori == 'ccw':
-                next_idx = i
-            elif ori == 'col':  # they're co-linear, can choose whether to take point or not
-                pivot_to_i_dist2 = utils.dist2(points[pivot_idx], points[i])
-                pivot_to_next_dist2 = utils.dist2(points[pivot_idx], points[next_idx])
-                if pivot_to_i_dist2 > pivot_to_next_dist2:
-                    # Take farther point.
-                    next_idx = i
-
-        pivot_idx = next_idx  # continue from new pivot
-
-        # if we've wrapped back around to the original pivot, we've completed the hull.
-        if (pivot_idx == leftmost_idx):
-            break
-
-    res = [points[idx] for idx in res]
-
-    if include_colinear_edge_points:
-        res = _insert_colinear_edge_points(res, points)
-
-    return res
-
-def _insert_colinear_edge_points(hull, points):
-    in_hull_already = set(hull)
-    res = []
-    for i in range(len(hull)):
-        e1 = hull[i]
-        e2 = hull[(i + 1) % len(hull)]
-
-        colinears = []
-        for p in points:
-            if p in in_hull_already:
-                continue
-            elif utils.dist_from_point_to_line(p, e1, e2, segment=True) < 0.0001:
-                colinears.append(p)
-
-        colinears.sort(key=lambda x: utils.dist(e1, x))
-
-        res.append(e1)
-        res.extend(colinears)
-        in_hull_already.update(colinears)
-
-    return res
-
-
+        return points
+
+    def _is_popped(o, a, b):
+        # whether a is inside (or, unless include_colinear_edge_points, on) the line from o to b
+        dist = _cross(o, a, b) / utils.dist(o, b)
+        return dist < -thresh if include_colinear_edge_points else dist <= thresh
+
+    def _half_hull(pts):
+        res = []
+        for p in pts:
+            while len(res) >= 2 and _is_popped(res[-2], res[-1], p):
+                res.pop()
+            res.append(p)
+        return res
+
+    lower = _half_hull(points)
+    upper = _half_hull(reversed(points))
+    if len(lower) == len(points) and len(upper) == len(points):
+        return lower  # they're all colinear
+
+    return lower[:-1] + upper[:-1]
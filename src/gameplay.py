@@ -1,3 +1,4 @@
+import copy
 import math
 import typing
 import random
@@ -5,6 +6,9 @@ import time
 
 import const
 import src.convexhull as convexhull
+import src.picking as picking
+import src.planar as planar
+import src.topology as topology
 import src.utils as utils
 
 import pygame
@@ -29,17 +33,18 @@ class GameState:
         self.level = levels.LEVELS[level_idx % len(levels.LEVELS)]
         self.board = Board.new_board(*self.level.style)
 
-        cur_regions = self.board.calc_regions()
-        self.board_bg_polygon = cur_regions[0].polygon  # only used for rendering
-        self.current_regions = cur_regions
+        self._board_regions = self.board.calc_regions()
+        self.board_bg_polygon = self._board_regions[0].polygon  # only used for rendering
+        self.current_regions = [r.copy() for r in self._board_regions]
 
         params = goals.GoalGenParams()
-        params.banned_polys.append(self.board_bg_polygon)
-        params.banned_polys.extend(self.level.banned_polys)
+        params.banned_polys.add(self.board_bg_polygon)
+        params.banned_polys.add_all(self.level.banned_polys)
         params.min_n_vertices = self.level.min_vertices
         params.max_n_vertices = self.level.max_vertices
+        params.sampler = self.level.goal_sampler
 
-        self.goal_generator = goals.GoalGenerator(self.board, params)
+        self.goal_worker = goals.GoalWorker(goals.GoalGenerator(self.board, params, use_catalog=True))
         self.goals: typing.List[goals.PolygonGoal] = []  # active_goals
         self.satisfied_goals = []
         self.finishing_goals_still_moving = []
@@ -61,6 +66,7 @@ class GameState:
         if new_idx >= len(levels.LEVELS):
             return None  # finished !
         else:
+            self.goal_worker.stop()
             gs = GameState(level_idx=new_idx)
             gs.temperature = self.temperature
             gs.add_temperature(0.25)  # lil boost
@@ -78,11 +84,14 @@ class GameState:
         return self.get_temperature() <= 0
 
     def update_regions(self, dt):
-        old_regions = set(self.current_regions)  # recalc in case updates caused deletions
-        new_regions = set(self.board.calc_regions())
-        to_add = [r for r in new_regions if r not in old_regions]
-        to_keep = [r for r in old_regions if r in new_regions]
-        self.current_regions = to_keep + to_add
+        board_regions = self.board.calc_regions()
+        if board_regions is not self._board_regions:  # board changed since last time
+            self._board_regions = board_regions
+            old_regions = set(self.current_regions)  # recalc in case updates caused deletions
+            new_regions = set(board_regions)
+            to_add = [r.copy() for r in new_regions if r not in old_regions]  # board's regions are shared, so copy
+            to_keep = [r for r in old_regions if r in new_regions]
+            self.current_regions = to_keep + to_add
 
         rate = 1 + self.level.max_temp_cure_boost * self.get_temperature(normalize=True)
         for r in self.current_regions:
@@ -90,6 +99,7 @@ class GameState:
 
     def remove_region(self, region):
         self.current_regions.remove(region)
+        self._board_regions = None  # re-sync with the board next update, even if no edges end up removed
         used_by_other_active_regions = EdgeSet()
         for r in self.current_regions:
             if r.is_satisfying_goal():
@@ -101,13 +111,13 @@ class GameState:
     def can_add_edge(self, edge, try_to_split=True):
         split_edges = self.board.try_to_split(edge) if try_to_split else [edge]
         concrete_regions = [r for r in self.current_regions if r.is_satisfying_goal()]
+        centers = [edge.center() for edge in split_edges]
         for r in concrete_regions:
+            if any(r.polygon.contains_points(centers)):
+                return False
             for edge in split_edges:
-                if r.polygon.contains_point(edge.center()):
+                if len(self.board.get_intersecting_edges(edge, r.edges)) > 0:
                     return False
-                for r_edge in r.edges:
-                    if edge.intersects(r_edge):
-                        return False
         return True
 
     def can_remove_edge(self, edge):
@@ -130,19 +140,24 @@ class GameState:
 
     def update_goals(self, dt, region_to_animator_mapping):
         # update active goals
+        open_regions = geometry.ShapeIndex()  # shape -> regions not satisfying a goal yet, in order
+        for region in self.current_regions:
+            if not region.is_satisfying_goal():
+                open_regions.setdefault(region.polygon, []).append(region)
+
         keep_goals = []
         for goal in self.goals:
             keep = True
             if not goal.is_satisfied():
-                for region in self.current_regions:
-                    if not region.is_satisfying_goal() and goal.is_satisfied_by(region):
-                        sounds.play_sound("pour")
-                        goal.set_satisfied(region)
-                        region.set_satisfying_goal(goal, cure_time=self.level.base_cure_time)
-                        keep = False
-                        self.satisfied_goals.append(goal)
-                        self.satisfied_goal(goal)
-                        break
+                matches = open_regions.get(goal.polygon)
+                if matches:
+                    region = matches.pop(0)
+                    sounds.play_sound("pour")
+                    goal.set_satisfied(region)
+                    region.set_satisfying_goal(goal, cure_time=self.level.base_cure_time)
+                    keep = False
+                    self.satisfied_goals.append(goal)
+                    self.satisfied_goal(goal)
             if keep:
                 keep_goals.append(goal)
 
@@ -151,10 +166,8 @@ class GameState:
         # gen new goals
         if len(self.goals) < const.N_GOALS:
             temp_banned = [s.polygon for s in self.goals if s is not None] + [s.polygon for s in self.satisfied_goals]
-            for _ in range(const.N_GOALS - len(self.goals)):
-                new_goal = self.goal_generator.gen_next_goal(temp_banned_shapes=temp_banned, max_tries=1)
-                if new_goal is not None:
-                    self.goals.append(new_goal)
+            self.goals.extend(self.goal_worker.pop_goals(const.N_GOALS - len(self.goals),
+                                                         temp_banned_shapes=temp_banned))
 
         # rm regions of fully completed goals
         keep = []
@@ -201,13 +214,17 @@ class GameState:
 
 class BoardRegion:
 
-    def __init__(self, polygon, edges):
+    def __init__(self, polygon, edges, mask=None):
         self.polygon = polygon  # board space
         self.edges = edges
+        self.mask = mask  # the edges as a mask over the board topology's candidate edges, if they all are candidates
 
         self.satisfying_goal = None
         self.goal_time_remaining = 5
 
+    def copy(self) -> 'BoardRegion':
+        return BoardRegion(self.polygon, self.edges, mask=self.mask)
+
     def set_satisfying_goal(self, goal, cure_time=5):
         self.satisfying_goal = goal
         self.goal_time_remaining = cure_time
@@ -226,37 +243,105 @@ class BoardRegion:
             self.goal_time_remaining -= (dt / 1000) * rate
 
     def __hash__(self):
-        return hash(self.edges)
+        return hash(self.mask) if self.mask is not None else hash(self.edges)
 
     def __eq__(self, other):
+        if self.mask is not None and other.mask is not None:
+            return self.mask == other.mask
         return self.edges == other.edges
 
 
 class Board:
 
-    def __init__(self, pegs: typing.Iterable[typing.Tuple[float, float]]):
-        self.pegs = set(pegs)
-        self.outer_edges = self._calc_outer_edges()
-        self.user_edges = EdgeSet()
+    REGION_CACHE_SIZE = 64
+    INDEX_CELL_SIZE = 1 / 8  # for spatial lookups of edges
+
+    _TEMPLATES = {}  # (style, size) -> empty Board, see new_board
 
-    def copy(self, exclude_edges=False):
-        res = Board(self.pegs)
-        if not exclude_edges:
-            res.user_edges.add_all(self.user_edges)
+    def __init__(self, pegs: typing.Iterable[typing.Tuple[float, float]], region_cache: utils.LRUCache = None,
+                 lattice: typing.Dict[typing.Tuple[float, float], typing.Tuple[int, int]] = None):
+        pegs = set(pegs)
+
+        # optional integer coordinates for each peg, enabling exact geometry checks between pegs. They must map to
+        # board space through an orientation-preserving affine transform.
+        self.lattice = lattice
+        self.topology = topology.BoardTopology.get(pegs, lattice=lattice)
+
+        # the topology's copies of the points, so that every board with these pegs (and every edge in the topology's
+        # tables) shares the same tuples, and lookups between them can short-circuit on identity.
+        self.pegs = set(self.topology.pegs)
+
+        self.outer_edges = self._calc_outer_edges()
+        self.outer_nodes = frozenset(self.outer_edges.points_to_edges)
+        self.outer_mask = 0
+        for e in self.outer_edges:
+            eid = self.topology.edge_id(e)
+            if eid is not None:
+                self.outer_mask |= 1 << eid
+
+        # the user edges, as a mask over the topology's candidate edges (see BoardTopology). This is the board's
+        # state, everything else (user_edges, the faces, the regions) is derived from it.
+        self.user_mask = 0
+        self._user_edge_view = None  # EdgeSet of the edges in user_mask, built on demand
+
+        # the faces of the board with no user edges. Boards start from (and reset to) a shared copy of this.
+        self._reset_faces()
+        self._empty_faces = (self._faces, self._face_regions, self._dirty_faces)
+        self._faces_shared = True  # whether the faces must be copied before they're modified
+
+        # user mask -> regions, shared between copies (since they have the same pegs)
+        self.region_cache = region_cache if region_cache is not None else utils.LRUCache(Board.REGION_CACHE_SIZE)
+
+    def copy(self, exclude_edges=False, share_caches=True):
+        """share_caches: if False, the copy gets its own region cache and faces, so it can be used on a different
+            thread than this board.
+        """
+        res = copy.copy(self)  # the pegs, topology and outer edges are never modified, so they're shared
+        res._user_edge_view = None
+        if not share_caches:
+            res.region_cache = utils.LRUCache(self.region_cache.max_size)
+            faces, face_regions, dirty_faces = self._empty_faces
+            res._empty_faces = (faces.copy(), dict(face_regions), set(dirty_faces))
+        if exclude_edges:
+            res._clear_user_mask()
+        elif share_caches:
+            # copy-on-write, whichever board changes its edges first makes its own copy of the faces
+            self._faces_shared = res._faces_shared = True
+        else:
+            res._faces_shared = True
+            res._own_faces()
         return res
 
+    @property
+    def user_edges(self) -> EdgeSet:
+        """The user edges, as an EdgeSet view of user_mask. Don't mutate it."""
+        if self._user_edge_view is None:
+            self._user_edge_view = EdgeSet(cell_size=Board.INDEX_CELL_SIZE)
+            self._user_edge_view.add_all(self.topology.edges_in_mask(self.user_mask))
+        return self._user_edge_view
+
     @staticmethod
     def new_board(style: str, size):
+        """returns: an empty board. Boards of the same style and size share their pegs, outer edges, etc."""
+        key = (style, size)
+        if key not in Board._TEMPLATES:
+            Board._TEMPLATES[key] = Board._build_board(style, size)
+        return Board._TEMPLATES[key].copy(exclude_edges=True)
+
+    @staticmethod
+    def _build_board(style: str, size):
         if style == "SQUARE":
             return Board.new_rectangle_board((size, size))
         if style == "RECT":
             return Board.new_rectangle_board(size)
         if style == "HEX":
             return Board.new_hex_board(size)
+        raise ValueError(f"unrecognized board style: {style}")
 
     @staticmethod
     def new_rectangle_board(dims: typing.Tuple[int, int]):
         pegs = []
+        lattice = {}
 
         width = 1
         height = 1
@@ -270,7 +355,8 @@ class Board:
                 x = (x_idx / (dims[0] - 1)) * width + (1 - width) / 2
                 y = (y_idx / (dims[1] - 1)) * height + (1 - height) / 2
                 pegs.append((x, y))
-        return Board(pegs)
+                lattice[(x, y)] = (x_idx, y_idx)
+        return Board(pegs, lattice=lattice)
 
     @staticmethod
     def new_hex_board(size):
@@ -279,6 +365,7 @@ class Board:
             raise ValueError(f"rows must be odd: {rows}")
         board_height = (rows - 1) / (cols - 1) * math.sqrt(3) / 2
         pegs = []
+        lattice = {}  # axial coordinates (q, r)
         for y in range(rows):
             n_pts_in_row = cols - int(abs(y - (rows - 1) / 2))
             y_pos = y / (rows - 1) * board_height + (1 - board_height) / 2
@@ -288,10 +375,15 @@ class Board:
                 x_spacing = 1 / (cols - 1)
                 for x in range(n_pts_in_row):
                     pegs.append((x_start + x * x_spacing, y_pos))
-        return Board(pegs)
+
+                    # in half-spacing units, this peg is at 2 * x - (n_pts_in_row - 1) from the center line, which
+                    # always has the same parity as y + (cols - 1 - (rows - 1) // 2). Axial q is what's left over.
+                    doubled_x = 2 * x - (n_pts_in_row - 1) - (cols - 1 - (rows - 1) // 2) % 2
+                    lattice[pegs[-1]] = ((doubled_x - y) // 2, y)
+        return Board(pegs, lattice=lattice)
 
     def _calc_outer_edges(self) -> 'EdgeSet':
-        res = EdgeSet()
+        res = EdgeSet(cell_size=Board.INDEX_CELL_SIZE)
         outer_pegs = convexhull.compute(list(self.pegs), include_colinear_edge_points=True)
         for i in range(len(outer_pegs)):
             p1 = outer_pegs[i]
@@ -299,11 +391,45 @@ class Board:
             res.add(Edge(p1, p2))
         return res
 
+    def _to_lattice(self, edge):
+        if self.lattice is not None and edge.p1 in self.lattice and edge.p2 in self.lattice:
+            return self.lattice[edge.p1], self.lattice[edge.p2]
+        return None
+
+    def edges_intersect(self, e1: Edge, e2: Edge) -> bool:
+        l1 = self._to_lattice(e1)
+        l2 = self._to_lattice(e2) if l1 is not None else None
+        if l2 is not None:
+            return geometry.lattice_segments_intersect(*l1, *l2)
+        return e1.intersects(e2)
+
+    def get_intersecting_edges(self, edge: Edge, edges) -> typing.List[Edge]:
+        edges = list(edges)
+        if geometry.np is None or len(edges) < geometry.BATCH_MIN_SIZE:
+            return [e for e in edges if self.edges_intersect(edge, e)]
+
+        ab = self._to_lattice(edge)
+        if ab is not None and all(e.p1 in self.lattice and e.p2 in self.lattice for e in edges):
+            segs = [(*self.lattice[e.p1], *self.lattice[e.p2]) for e in edges]
+            hits = geometry.lattice_intersects_many(*ab, segs)
+        else:
+            hits = geometry.intersects_many(edge, edges)
+        return [edges[i] for i in geometry.np.flatnonzero(hits)]
+
     def try_to_split(self, edge):
-        pts_inside = [edge.p1]
-        for pt in self.all_nodes():
-            if edge.contains_point(pt, including_endpoints=False):
-                pts_inside.append(pt)
+        split = self.topology.split(edge)
+        if split is not None:
+            return split
+
+        # edge doesn't go between two pegs, so do it the slow way
+        if geometry.np is not None:
+            inside = geometry.contains_points(edge, self.topology.peg_array, including_endpoints=False)
+            pts_inside = [edge.p1] + [self.topology.peg_list[i] for i in geometry.np.flatnonzero(inside)]
+        else:
+            pts_inside = [edge.p1]
+            for pt in self.all_nodes():
+                if edge.contains_point(pt, including_endpoints=False):
+                    pts_inside.append(pt)
         pts_inside.append(edge.p2)
         if len(pts_inside) == 2:
             return [edge]
@@ -315,6 +441,10 @@ class Board:
             return res
 
     def can_add_user_edge(self, edge, split_if_necessary=True, get_problems=False):
+        eid = self.topology.edge_id(edge)
+        if eid is not None:
+            return self._can_add_user_edge_by_mask(eid, split_if_necessary, get_problems)
+
         split_edges = self.try_to_split(edge) if split_if_necessary else [edge]
         problems = {}
 
@@ -344,38 +474,74 @@ class Board:
                 else:
                     add_problem('overlaps_outer', edge)
 
-            if any(edge.intersects(e) for e in self.user_edges):
+            intersecting = self.get_intersecting_edges(edge, self.user_edges.edges_near_edge(edge))
+            if len(intersecting) > 0:
                 if not get_problems:
                     return False
                 else:
-                    add_problem('intersects', [e for e in self.user_edges if edge.intersects(e)])
+                    add_problem('intersects', intersecting)
 
         if get_problems:
             return problems
         else:
             return True
 
+    def _can_add_user_edge_by_mask(self, eid, split_if_necessary, get_problems):
+        # same checks as the general case, but against precomputed masks of candidate edges
+        topo = self.topology
+        parts = topo.part_masks[eid] if split_if_necessary else 1 << eid
+        conflicts = topo.split_conflicts[eid] if split_if_necessary else topo.conflicts[eid]
+
+        overlaps = parts & self.user_mask
+        overlaps_outer = parts & self.outer_mask
+        intersects = conflicts & self.user_mask
+        if not get_problems:
+            return not (overlaps or overlaps_outer or intersects)
+
+        problems = {}
+        for key, mask in (('overlaps', overlaps), ('overlaps_outer', overlaps_outer), ('intersects', intersects)):
+            if mask:
+                problems[key] = EdgeSet().add_all(topo.edges_in_mask(mask))
+        return problems
+
     def add_user_edge(self, edge: 'Edge', split_if_necessary=True) -> bool:
         split_edges = self.try_to_split(edge) if split_if_necessary else [edge]
 
         if all(self.can_add_user_edge(e, split_if_necessary=False) for e in split_edges):
-            self.user_edges.add_all(split_edges)
+            self._own_faces()
+            for e in split_edges:
+                self.user_mask |= 1 << self.topology.edge_id(e)  # it's between pegs, or it couldn't be added
+                if self._user_edge_view is not None:
+                    self._user_edge_view.add(e)
+                self._update_faces(self._faces.add_edge(e.p1, e.p2))
             return True
         else:
             return False
 
     def can_remove_user_edge(self, edge: 'Edge') -> bool:
-        return edge in self.user_edges
+        eid = self.topology.edge_id(edge)
+        return eid is not None and (self.user_mask >> eid) & 1 == 1
 
     def remove_user_edge(self, edge: 'Edge') -> bool:
         if self.can_remove_user_edge(edge):
-            self.user_edges.remove(edge)
+            self.user_mask &= ~(1 << self.topology.edge_id(edge))
+            if self._user_edge_view is not None:
+                self._user_edge_view.remove(edge)
+            self._own_faces()
+            self._update_faces(self._faces.remove_edge(edge.p1, edge.p2))
             return True
         return False
 
+    def _clear_user_mask(self):
+        self.user_mask = 0
+        self._user_edge_view = None
+        self._faces, self._face_regions, self._dirty_faces = self._empty_faces
+        self._faces_shared = True
+        self._regions = None
+
     def clear_user_edges(self, force=False):
         if force:
-            self.user_edges.clear()  # not wise if there's active concrete
+            self._clear_user_mask()  # not wise if there's active concrete
         else:
             all_edges = list(self.all_edges(including_outer=False))
             for edge in all_edges:
@@ -388,9 +554,11 @@ class Board:
 
     def get_edges_in_circle(self, xy, radius, including_outer=True):
         res = []
-        for edge in self.all_edges(including_outer=including_outer):
-            if edge.dist_to_point(xy) <= radius:
-                res.append(edge)
+        edge_sets = (self.user_edges, self.outer_edges) if including_outer else (self.user_edges,)
+        for edge_set in edge_sets:
+            for edge in edge_set.edges_near_point(xy, radius):
+                if edge.dist_to_point(xy) <= radius:
+                    res.append(edge)
         res.sort(key=lambda x: x.dist_to_point(xy))
         return res
 
@@ -419,90 +587,94 @@ class Board:
             yield n
 
     def is_outer_node(self, xy):
-        return xy in self.outer_edges.points_to_edges
+        return xy in self.outer_nodes
 
     def calc_polygons(self) -> typing.List[geometry.Polygon]:
         return [region.polygon for region in self.calc_regions()]
 
     def calc_regions(self) -> typing.List[BoardRegion]:
-
-        graph = {}  # node -> list of connected nodes
+        """returns: the board's current regions. The list is cached, don't mutate it (or the regions)."""
+        if self._regions is None:
+            self._regions = self.region_cache.get(self.user_mask)
+            if self._regions is None:
+                # if the faces are shared, this fills in the other boards' regions too (they're the same)
+                for cid in self._dirty_faces:
+                    self._face_regions[cid] = self._make_region(self._faces.cycles()[cid])
+                self._dirty_faces.clear()
+                self._regions = [r for r in self._face_regions.values() if r is not None]
+                self.region_cache.put(self.user_mask, self._regions)
+        return self._regions
+
+    def _make_region(self, walk) -> typing.Optional[BoardRegion]:
+        """returns: the region bounded by a face's boundary walk, or None if the face isn't a region.
+
+            If something inside the face touches its boundary at one node (e.g. a polygon that meets it at a corner),
+            the walk passes through that node twice. It's split into simple loops there, and the region is the one
+            going around the outside. The others are holes in it, which are left out of the region (polygon and
+            edges), just like holes that don't touch the boundary.
+        """
+        if planar.signed_area(walk) >= 0:
+            return None  # outer boundary (or a hole, or a dangling tree), not a region
+
+        path = list(walk)
+        keep_going = True
+        while keep_going and len(path) > 2:  # remove backtracking (from dangling edges)
+            keep_going = False
+            for i in range(len(path)):
+                if path[i] == path[(i + 2) % len(path)]:
+                    to_rm = tuple(sorted([(i + 2) % len(path), (i + 1) % len(path)]))
+                    path.pop(to_rm[1])
+                    path.pop(to_rm[0])
+                    keep_going = True
+                    break
+
+        loops = planar.split_loops(path)
+        path = min(loops, key=planar.signed_area)
+        if len(path) <= 2:
+            return None
+        holes = set()
+        for loop in loops:
+            if loop is not path:
+                holes.update(Edge(loop[i], loop[(i + 1) % len(loop)]) for i in range(len(loop)))
+
+        edges = EdgeSet()
+        mask = 0
+        for i in range(len(walk)):
+            edge = Edge(walk[i], walk[(i + 1) % len(walk)])
+            if edge in holes:
+                continue
+            edges.add(edge)
+            eid = self.topology.edge_id(edge)
+            if eid is None:
+                mask = None
+            elif mask is not None:
+                mask |= 1 << eid
+
+        return BoardRegion(geometry.Polygon(path), edges, mask=mask)
+
+    def _reset_faces(self):
+        self._faces = planar.PlanarFaces()
+        self._face_regions = {}  # cycle id -> BoardRegion, or None if the cycle doesn't bound a region
+        self._dirty_faces = set()  # cycle ids whose regions haven't been built yet
+        self._regions = None
         for edge in self.all_edges(including_outer=True):
-            if edge.p1 not in graph:
-                graph[edge.p1] = set()
-            if edge.p2 not in graph:
-                graph[edge.p2] = set()
-            graph[edge.p1].add(edge.p2)
-            graph[edge.p2].add(edge.p1)
-
-        def pop_edge(n1, n2):
-            edges = graph[n1]
-            edges.remove(n2)
-            if len(edges) == 0:
-                del graph[n1]
-                return True
-            return False
+            self._update_faces(self._faces.add_edge(edge.p1, edge.p2))
 
-        def find_next_step(prev, cur):
-            v1 = pygame.Vector2(utils.sub(prev, cur))
-            best_ang = float('inf')
-            best = None
-            for n in graph[cur]:
-                vn = pygame.Vector2(utils.sub(n, cur))
-                ccw_ang = utils.ccw_angle_to_rads(v1, vn)
-                if (n != prev and ccw_ang < best_ang) or best is None:
-                    best_ang = ccw_ang if n != prev else float('inf')
-                    best = n
-            return best, (best_ang if best_ang < float('inf') else 0)
-
-        def remove_backtracking(pt_list):
-            keep_going = True
-            while keep_going and len(pt_list) > 2:
-                keep_going = False
-                for i in range(len(pt_list)):
-                    if pt_list[i] == pt_list[(i + 2) % len(pt_list)]:
-                        to_rm = tuple(sorted([(i + 2) % len(pt_list), (i + 1) % len(pt_list)]))
-                        pt_list.pop(to_rm[1])
-                        pt_list.pop(to_rm[0])
-                        keep_going = True
-                        break
-
-        def recover_edges(pth) -> 'EdgeSet':
-            res = EdgeSet()
-            for i in range(len(pth)):
-                n1 = pth[i]
-                n2 = pth[(i + 1) % len(pth)]
-                res.add(Edge(n1, n2))
-            return res
-
-        regions = []
-        while len(graph) > 0:
-            path = [next(iter(graph.keys()))]  # choose any first node
-            path.append(next(iter(graph[path[0]])))  # choose any first edge
-            pop_edge(*path)
-            total_ang = 0
-
-            keep_going = True
-            while keep_going:
-                next_node, ang = find_next_step(path[-2], path[-1])
-
-                pop_edge(path[-1], next_node)
-                total_ang += ang - math.pi  # want to end up with 360 or -360 total
-
-                if next_node == path[0]:
-                    # completed the loop
-                    keep_going = False
-                    if total_ang < 0:
-                        edges = recover_edges(path)
-                        remove_backtracking(path)
-                        if len(path) > 2:
-                            regions.append(BoardRegion(geometry.Polygon(path), edges))
-                    else:
-                        pass  # inverted poly, discard
-                else:
-                    path.append(next_node)
+    def _own_faces(self):
+        if self._faces_shared:
+            self._faces = self._faces.copy()
+            self._face_regions = dict(self._face_regions)
+            self._dirty_faces = set(self._dirty_faces)
+            self._faces_shared = False
 
-        return regions
+    def _update_faces(self, changes):
+        removed, added = changes
+        for cid in removed:
+            self._face_regions.pop(cid, None)
+            self._dirty_faces.discard(cid)
+        self._dirty_faces.update(added)
+        if len(removed) > 0 or len(added) > 0:
+            self._regions = None
 
 
 def fresh_gameplay_scene() -> 'GameplayScene':
@@ -537,9 +709,14 @@ class GameplayScene(scenes.Scene):
         self.potential_edge = None  # edge that's being dragged
         self.potential_edge_problems = {}
 
+        self.pick_buffer = picking.PickBuffer(self.board_area, const.CLICK_DISTANCE_PX)
+
         self.rot_time = 0
         self.region_to_animator_mapping = {}
 
+    def on_discard(self):
+        self.gs.goal_worker.stop()
+
     def update(self, dt, fake=False):
         super().update(dt)
 
@@ -581,7 +758,11 @@ class GameplayScene(scenes.Scene):
             if n.is_satisfying_goal() and n not in self.region_to_animator_mapping:
                 screen_poly = geometry.Polygon([self.board_xy_to_screen_xy(v) for v in n.polygon.vertices])
                 bb = utils.bounding_box(screen_poly.vertices)
-                filler = cementfill.Filler(screen_poly, bb, total_time=n.goal_time_remaining, fill_time_pcnt=0.5)
+                # pours in about sqrt(cure time / 60) secs, then dries over half the cure time
+                cure_time = n.goal_time_remaining
+                pour_time = math.sqrt(cure_time / 60)
+                total_time = pour_time + 0.5 * cure_time
+                filler = cementfill.Filler(screen_poly, bb, total_time=total_time, fill_time_pcnt=pour_time / total_time)
                 self.region_to_animator_mapping[n] = (filler, bb)
 
         for (k, v) in self.region_to_animator_mapping.items():
@@ -615,16 +796,20 @@ class GameplayScene(scenes.Scene):
     def can_remove_edge(self, edge):
         return self.gs.can_remove_edge(edge) and self.gs.board.can_remove_user_edge(edge)
 
+    def _update_pick_buffer(self):
+        board = self.gs.board
+        self.pick_buffer.update_pegs(board.pegs, board, self.board_xy_to_screen_xy)
+        self.pick_buffer.update_edges(board.user_edges, (board.topology, board.user_mask), self.board_xy_to_screen_xy)
+
     def handle_board_mouse_events(self):
-        click_dist = self.screen_dist_to_board_dist(const.CLICK_DISTANCE_PX)
+        self._update_pick_buffer()
         if self.potential_edge is not None:
             if pygame.BUTTON_RIGHT in const.MOUSE_PRESSED_AT_THIS_FRAME:
                 sounds.play_sound('back')  # drag canceled
                 self.cancel_current_drag()
             elif pygame.BUTTON_LEFT in const.MOUSE_RELEASED_AT_THIS_FRAME:
                 scr_xy = const.MOUSE_RELEASED_AT_THIS_FRAME[pygame.BUTTON_LEFT]
-                b_xy = self.screen_xy_to_board_xy(scr_xy)
-                dest_node = self.gs.board.get_closest_node(b_xy, max_dist=click_dist)
+                dest_node = self.pick_buffer.peg_at(scr_xy)
                 if dest_node is None or dest_node == self.potential_edge.p1:
                     sounds.play_sound('back')  # drag cancelled
                     self.cancel_current_drag()
@@ -661,21 +846,20 @@ class GameplayScene(scenes.Scene):
         elif pygame.BUTTON_LEFT in const.MOUSE_PRESSED_AT_THIS_FRAME:
             scr_xy = const.MOUSE_PRESSED_AT_THIS_FRAME[pygame.BUTTON_LEFT]
             b_xy = self.screen_xy_to_board_xy(scr_xy)
-            start_node = self.gs.board.get_closest_node(b_xy, max_dist=click_dist)
+            start_node = self.pick_buffer.peg_at(scr_xy)
             if start_node is not None:
                 sounds.play_sound("start_line")  # started dragging
                 self.potential_edge = Edge(start_node, b_xy)
         elif pygame.BUTTON_RIGHT in const.MOUSE_PRESSED_AT_THIS_FRAME:
             scr_xy = const.MOUSE_PRESSED_AT_THIS_FRAME[pygame.BUTTON_RIGHT]
-            b_xy = self.screen_xy_to_board_xy(scr_xy)
-            edge = self.gs.board.get_closest_edge(b_xy, max_dist=click_dist, including_outer=False)
+            edge = self.pick_buffer.edge_at(scr_xy)
             if edge is not None and self.can_remove_edge(edge):
                 sounds.play_sound("delete_line", volume=0.5)  # deleted line
                 self.gs.board.remove_user_edge(edge)
 
         if self.potential_edge is not None and const.MOUSE_XY is not None:
             b_xy = self.screen_xy_to_board_xy(const.MOUSE_XY)
-            dest_node = self.gs.board.get_closest_node(b_xy, max_dist=click_dist)
+            dest_node = self.pick_buffer.peg_at(const.MOUSE_XY)
             if dest_node is None or dest_node == self.potential_edge.p1:
                 self.potential_edge = Edge(self.potential_edge.p1, b_xy)
             else:
@@ -6,68 +6,148 @@ import pygame
 import const
 import src.utils as utils
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # batch functions below need it, callers should check geometry.np first
+
+BATCH_MIN_SIZE = 8  # below this many items, numpy's per-call overhead isn't worth it
+
+# polygon signatures round angles (in degrees) and edge ratios to multiples of these
+SIGNATURE_ANGLE_QUANTUM = 0.01
+SIGNATURE_RATIO_QUANTUM = 0.0001
+
+# shifts the rounding boundaries off of 'nice' values (like 22.5 degrees, or a ratio of 1/8), so that floating
+# point noise can't push two copies of the same shape into different buckets.
+_SIGNATURE_OFFSET = 0.3183
+
 class Edge:
 
+    __slots__ = ('p1', 'p2', 'key', '_hash')
+
     def __init__(self, p1, p2):
         self.p1 = p1  # for the love of god, treat these as immutable
         self.p2 = p2
 
+        # the endpoints in a canonical order, so an edge equals (and hashes like) its reverse. p1 and p2 keep the
+        # order they were given in, since some callers care which end is which.
+        self.key = (p1, p2) if p1 <= p2 else (p2, p1)
+        self._hash = hash(self.key)
+
     def points(self):
         return (self.p1, self.p2)
 
     def contains_point(self, pt, including_endpoints=False):
-        dist = self.dist_to_point(pt)
-        if dist < const.THRESH:
+        px, py = pt
+        x1, y1 = self.p1
+        x2, y2 = self.p2
+        if utils.dist_to_segment_xy(px, py, x1, y1, x2, y2) < const.THRESH:
             if including_endpoints:
                 return True
             else:
-                dist_p1 = utils.dist(pt, self.p1)
-                dist_p2 = utils.dist(pt, self.p2)
-                return dist_p1 > const.THRESH and dist_p2 > const.THRESH
+                return utils.dist_xy(px, py, x1, y1) > const.THRESH and utils.dist_xy(px, py, x2, y2) > const.THRESH
+        return False
 
     def dist_to_point(self, pt):
-        return utils.dist_from_point_to_line(pt, self.p1, self.p2, segment=True)
+        return utils.dist_to_segment_xy(pt[0], pt[1], *self.p1, *self.p2)
 
     def intersects(self, other: 'Edge'):
-        xy = utils.line_line_intersection(self.p1, self.p2, other.p1, other.p2)
+        x1, y1 = self.p1
+        x2, y2 = self.p2
+        x3, y3 = other.p1
+        x4, y4 = other.p2
+        xy = utils.line_line_intersection_xy(x1, y1, x2, y2, x3, y3, x4, y4)
         if xy is None:
             return (self.contains_point(other.p1) or self.contains_point(other.p2) or  # lines are parallel
                     other.contains_point(self.p1) or other.contains_point(self.p2))
+        ix, iy = xy
 
-        if (utils.dist_from_point_to_line(xy, self.p1, self.p2, segment=True) > const.THRESH
-                or utils.dist_from_point_to_line(xy, other.p1, other.p2, segment=True) > const.THRESH):
+        if (utils.dist_to_segment_xy(ix, iy, x1, y1, x2, y2) > const.THRESH
+                or utils.dist_to_segment_xy(ix, iy, x3, y3, x4, y4) > const.THRESH):
             return False  # intersect must be inside both edges
 
-        if min(utils.dist(xy, self.p1), utils.dist(xy, self.p2),
-               utils.dist(xy, other.p1), utils.dist(xy, other.p2)) < const.THRESH:
+        if min(utils.dist_xy(ix, iy, x1, y1), utils.dist_xy(ix, iy, x2, y2),
+               utils.dist_xy(ix, iy, x3, y3), utils.dist_xy(ix, iy, x4, y4)) < const.THRESH:
             return False  # intersect must not be at any endpoints
 
         return True
 
     def length(self):
-        return utils.dist(self.p1, self.p2)
+        x1, y1 = self.p1
+        x2, y2 = self.p2
+        return utils.dist_xy(x1, y1, x2, y2)
 
     def center(self, t=0.5):
-        return utils.lerp(self.p1, self.p2, t=t, clamp=True)
+        t = min(1, max(0, t))
+        x1, y1 = self.p1
+        x2, y2 = self.p2
+        return (x1 + t * (x2 - x1), y1 + t * (y2 - y1))
 
     def __eq__(self, other):
-        return (self.p1 == other.p1 and self.p2 == other.p2) \
-            or (self.p2 == other.p1 and self.p1 == other.p2)
+        return self is other or (isinstance(other, Edge) and self._hash == other._hash and self.key == other.key)
 
     def __hash__(self):
-        return hash(self.p1) + hash(self.p2)
+        return self._hash
 
     def __repr__(self):
         return f"{type(self).__name__}(({self.p1[0]:.2f}, {self.p1[1]:.2f}), ({self.p2[0]:.2f}, {self.p2[1]:.2f}))"
 
 class EdgeSet:
 
-    def __init__(self):
+    def __init__(self, cell_size=None):
         self.edges = set()
         self.points_to_edges = {}  # pt -> set of Edges
+        self.fingerprint = 0  # xor of the edges' fingerprints, identifies the set's contents
+
+        # optional uniform grid for spatial queries, each edge is in every cell its bounding box touches
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> set of Edges
+
+    def _cells_in_box(self, min_x, min_y, max_x, max_y):
+        cs = self.cell_size
+        for cx in range(math.floor(min_x / cs), math.floor(max_x / cs) + 1):
+            for cy in range(math.floor(min_y / cs), math.floor(max_y / cs) + 1):
+                yield (cx, cy)
+
+    def _edge_cells(self, edge: Edge):
+        (x1, y1), (x2, y2) = edge.points()
+        return self._cells_in_box(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    def edges_in_box(self, min_x, min_y, max_x, max_y):
+        """returns: the edges whose bounding boxes might overlap the given box (and maybe some that don't)."""
+        if self.cell_size is None or not all(math.isfinite(v) for v in (min_x, min_y, max_x, max_y)):
+            return self.edges
+        n_cells = (((max_x - min_x) // self.cell_size) + 2) * (((max_y - min_y) // self.cell_size) + 2)
+        if n_cells > len(self.cells):
+            return self.edges  # cheaper to just check everything
+        res = set()
+        for c in self._cells_in_box(min_x, min_y, max_x, max_y):
+            if c in self.cells:
+                res.update(self.cells[c])
+        return res
+
+    def edges_near_edge(self, edge: Edge, margin=const.THRESH):
+        (x1, y1), (x2, y2) = edge.points()
+        return self.edges_in_box(min(x1, x2) - margin, min(y1, y2) - margin,
+                                 max(x1, x2) + margin, max(y1, y2) + margin)
+
+    def edges_near_point(self, xy, radius):
+        return self.edges_in_box(xy[0] - radius, xy[1] - radius, xy[0] + radius, xy[1] + radius)
+
+    @staticmethod
+    def edge_fingerprint(edge: Edge) -> int:
+        return hash(edge)
 
     def add(self, edge: Edge):
+        if edge in self.edges:
+            return self
         self.edges.add(edge)
+        self.fingerprint ^= EdgeSet.edge_fingerprint(edge)
+        if self.cell_size is not None:
+            for c in self._edge_cells(edge):
+                if c not in self.cells:
+                    self.cells[c] = set()
+                self.cells[c].add(edge)
         for p in edge.points():
             if p not in self.points_to_edges:
                 self.points_to_edges[p] = set()
@@ -82,6 +162,13 @@ class EdgeSet:
     def remove(self, edge: Edge):
         if edge in self.edges:
             self.edges.remove(edge)
+            self.fingerprint ^= EdgeSet.edge_fingerprint(edge)
+            if self.cell_size is not None:
+                for c in self._edge_cells(edge):
+                    if c in self.cells:
+                        self.cells[c].discard(edge)
+                        if len(self.cells[c]) == 0:
+                            del self.cells[c]
             for p in edge.points():
                 if p in self.points_to_edges:
                     if edge in self.points_to_edges[p]:
@@ -96,6 +183,8 @@ class EdgeSet:
     def clear(self):
         self.edges.clear()
         self.points_to_edges.clear()
+        self.fingerprint = 0
+        self.cells.clear()
 
     def __contains__(self, edge):
         return edge in self.edges
@@ -113,23 +202,186 @@ class EdgeSet:
         return self.edges == other.edges
 
     def __hash__(self):
-        return sum(hash(e) for e in self.edges)
+        return self.fingerprint
+
+# Exact predicates for points with integer (lattice) coordinates. These agree with the float versions above
+# (minus the fuzz) as long as the lattice maps to board space with an orientation-preserving affine transform.
+
+def lattice_cross(o, a, b) -> int:
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def lattice_segment_contains(a, b, pt) -> bool:
+    """Whether pt lies on segment ab, excluding the endpoints."""
+    if lattice_cross(a, b, pt) != 0:
+        return False
+    return ((pt[0] - a[0]) * (b[0] - a[0]) + (pt[1] - a[1]) * (b[1] - a[1]) > 0 and
+            (pt[0] - b[0]) * (a[0] - b[0]) + (pt[1] - b[1]) * (a[1] - b[1]) > 0)
+
+
+def lattice_segments_intersect(a, b, c, d) -> bool:
+    """Same semantics as Edge.intersects: segments ab and cd cross at a point that isn't an endpoint of either,
+        or they're colinear and overlap by a nonzero length.
+    """
+    d1 = lattice_cross(a, b, c)
+    d2 = lattice_cross(a, b, d)
+    if d1 == 0 and d2 == 0:
+        return (lattice_segment_contains(a, b, c) or lattice_segment_contains(a, b, d) or
+                lattice_segment_contains(c, d, a) or lattice_segment_contains(c, d, b))
+    return d1 * d2 < 0 and lattice_cross(c, d, a) * lattice_cross(c, d, b) < 0
+
+
+def lattice_segments_touch(a, b, c, d) -> bool:
+    """Whether closed segments ab and cd share any point. Unlike lattice_segments_intersect, this includes touching
+        at endpoints, which makes a polygon non-simple (unless the segments are adjacent sides).
+    """
+    d1 = lattice_cross(c, d, a)
+    d2 = lattice_cross(c, d, b)
+    d3 = lattice_cross(a, b, c)
+    d4 = lattice_cross(a, b, d)
+    if ((d1 > 0 > d2) or (d1 < 0 < d2)) and ((d3 > 0 > d4) or (d3 < 0 < d4)):
+        return True
+
+    def on_segment(p, q, pt):  # for colinear points only
+        return min(p[0], q[0]) <= pt[0] <= max(p[0], q[0]) and min(p[1], q[1]) <= pt[1] <= max(p[1], q[1])
+
+    return ((d1 == 0 and on_segment(c, d, a)) or (d2 == 0 and on_segment(c, d, b)) or
+            (d3 == 0 and on_segment(a, b, c)) or (d4 == 0 and on_segment(a, b, d)))
+
+
+def lattice_points_between(a, b) -> typing.List[typing.Tuple[int, int]]:
+    """returns: the lattice points strictly between a and b, in order from a to b."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    n = math.gcd(dx, dy)
+    if n <= 1:
+        return []
+    return [(a[0] + k * dx // n, a[1] + k * dy // n) for k in range(1, n)]
+
+
+# Steps for growing a simple polygon on the lattice one vertex at a time. The path is a list of indices into coords,
+# with segs[i] = (coords[path[i]], coords[path[i + 1]]).
+
+def lattice_path_can_extend(coords, path, segs, v) -> bool:
+    """Whether the path stays simple, with no flat vertices, when coords[v] (which isn't on it) is appended."""
+    last, pt = coords[path[-1]], coords[v]
+    if len(path) >= 2 and lattice_cross(coords[path[-2]], last, pt) == 0:
+        return False  # flat (or backtracking) vertex
+    return not any(lattice_segments_touch(a, b, last, pt) for (a, b) in segs[:-1])
+
+
+def lattice_path_can_close(coords, path, segs) -> bool:
+    """Whether closing the path (of at least 3 vertices) back to its start makes a simple polygon with no flat
+        vertices. The closing segment is adjacent to the first and last ones, and can't touch any of the others.
+    """
+    s, first, last, prev = coords[path[0]], coords[path[1]], coords[path[-1]], coords[path[-2]]
+    if lattice_cross(prev, last, s) == 0 or lattice_cross(last, s, first) == 0:
+        return False
+    return not any(lattice_segments_touch(a, b, last, s) for (a, b) in segs[1:-1])
+
+
+# Batch versions of the Edge and lattice checks, which test one edge against many points or segments at once.
+# Segments are (N, 4) arrays of [x1, y1, x2, y2] rows (or lists of Edges), points are (N, 2) arrays.
+
+def _segments_array(segments, dtype=float):
+    if np.ndim(segments) == 2:
+        return np.asarray(segments, dtype=dtype)
+    return np.array([(*e.p1, *e.p2) for e in segments], dtype=dtype).reshape(-1, 4)
+
+
+def _dists_to_segments(px, py, ax, ay, bx, by):
+    abx = bx - ax
+    aby = by - ay
+    len2 = abx * abx + aby * aby
+    t = np.clip(((px - ax) * abx + (py - ay) * aby) / np.where(len2 == 0, 1, len2), 0, 1)
+    return np.hypot(px - (ax + t * abx), py - (ay + t * aby))
+
+
+def _contains_many(px, py, ax, ay, bx, by, including_endpoints=False):
+    res = _dists_to_segments(px, py, ax, ay, bx, by) < const.THRESH
+    if not including_endpoints:
+        res &= (np.hypot(px - ax, py - ay) > const.THRESH) & (np.hypot(px - bx, py - by) > const.THRESH)
+    return res
+
+
+def contains_points(edge: Edge, points, including_endpoints=False):
+    """returns: bool array, whether each point satisfies edge.contains_point"""
+    pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    return _contains_many(pts[:, 0], pts[:, 1], *edge.p1, *edge.p2, including_endpoints=including_endpoints)
+
+
+def intersects_many(edge: Edge, segments):
+    """returns: bool array, whether edge.intersects each segment"""
+    x1, y1 = edge.p1
+    x2, y2 = edge.p2
+    x3, y3, x4, y4 = _segments_array(segments).T
+
+    denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    parallel = denominator == 0
+    denominator = np.where(parallel, 1, denominator)
+    det12 = x1 * y2 - y1 * x2
+    det34 = x3 * y4 - y3 * x4
+    ix = (det12 * (x3 - x4) - (x1 - x2) * det34) / denominator
+    iy = (det12 * (y3 - y4) - (y1 - y2) * det34) / denominator
+
+    # intersect must be inside both edges, and not at any endpoint
+    crosses = ((_dists_to_segments(ix, iy, x1, y1, x2, y2) <= const.THRESH)
+               & (_dists_to_segments(ix, iy, x3, y3, x4, y4) <= const.THRESH)
+               & (np.hypot(ix - x1, iy - y1) >= const.THRESH) & (np.hypot(ix - x2, iy - y2) >= const.THRESH)
+               & (np.hypot(ix - x3, iy - y3) >= const.THRESH) & (np.hypot(ix - x4, iy - y4) >= const.THRESH))
+
+    overlaps = (_contains_many(x3, y3, x1, y1, x2, y2) | _contains_many(x4, y4, x1, y1, x2, y2)
+                | _contains_many(x1, y1, x3, y3, x4, y4) | _contains_many(x2, y2, x3, y3, x4, y4))
+
+    return np.where(parallel, overlaps, crosses)
+
+
+def lattice_intersects_many(a, b, segments):
+    """returns: bool array, lattice_segments_intersect(a, b, c, d) for each integer segment [cx, cy, dx, dy]"""
+    cx, cy, dx, dy = _segments_array(segments, dtype=np.int64).T
+    ax, ay = a
+    bx, by = b
+
+    def cross(ox, oy, px, py, qx, qy):
+        return (px - ox) * (qy - oy) - (py - oy) * (qx - ox)
+
+    def strictly_between(px, py, qx, qy, tx, ty):  # for colinear points only
+        return ((tx - px) * (qx - px) + (ty - py) * (qy - py) > 0) & ((tx - qx) * (px - qx) + (ty - qy) * (py - qy) > 0)
+
+    d1 = cross(ax, ay, bx, by, cx, cy)
+    d2 = cross(ax, ay, bx, by, dx, dy)
+    colinear = (d1 == 0) & (d2 == 0)
+    crosses = (d1 * d2 < 0) & (cross(cx, cy, dx, dy, ax, ay) * cross(cx, cy, dx, dy, bx, by) < 0)
+    overlaps = (strictly_between(ax, ay, bx, by, cx, cy) | strictly_between(ax, ay, bx, by, dx, dy)
+                | strictly_between(cx, cy, dx, dy, ax, ay) | strictly_between(cx, cy, dx, dy, bx, by))
+    return np.where(colinear, overlaps, crosses)
+
 
 class Polygon:
 
+    __slots__ = ('vertices', '_edges', '_cached_angles', '_cached_length_ratios', '_cached_nonflat_vertices',
+                 '_cached_signatures', '_cached_bounding_box')
+
     def __init__(self, vertices):
         self.vertices = vertices  # immutable pls
-
-        self.edges = EdgeSet()
-        for i in range(len(self.vertices)):
-            p1 = self.vertices[i]
-            p2 = self.vertices[(i + 1) % len(self.vertices)]
-            self.edges.add(Edge(p1, p2))
+        self._edges = None  # built on first access, most polygons (e.g. transformed ones for rendering) never need it
 
         # used for scale-independent equivalence checking
         self._cached_angles = None
         self._cached_length_ratios = None
         self._cached_nonflat_vertices = None
+        self._cached_signatures = {}  # allow_mirrored -> signature
+
+        self._cached_bounding_box = None
+
+    @property
+    def edges(self) -> EdgeSet:
+        if self._edges is None:
+            self._edges = EdgeSet()
+            for i in range(len(self.vertices)):
+                p1 = self.vertices[i]
+                p2 = self.vertices[(i + 1) % len(self.vertices)]
+                self._edges.add(Edge(p1, p2))
+        return self._edges
 
     @staticmethod
     def _scale_to_new_bounding_box(vertices, new_bb):
@@ -178,21 +430,35 @@ class Polygon:
     def get_angles(self):
         return self.get_angles_and_edge_ratios()[0]
 
-    def is_equivalent_by_angles_and_edge_ratios(self, other, allow_mirrored=True):
-        # XXX in theory it might be possible to mismatched angle & edge arrays that happen
-        # to match independently... but that seems rare
-        my_angles, my_lengths = self.get_angles_and_edge_ratios()
-        other_angles, other_lengths = other.get_angles_and_edge_ratios()
-
-        if not utils.circular_lists_equal(my_angles, other_angles, thresh=const.THRESH):
-            if not allow_mirrored or not utils.circular_lists_equal(my_angles, list(reversed(other_angles)), thresh=const.THRESH):
-                return False
+    def get_signature(self, allow_mirrored=True) -> typing.Tuple[typing.Tuple[int, int], ...]:
+        """returns: a hashable key that's equal for polygons with the same angles and edge ratios, regardless of
+            scale, position, rotation, and (if allow_mirrored) reflection.
+
+            Each nonflat vertex becomes a pair of (quantized angle, quantized ratio of its outgoing edge), and the
+            signature is the lexicographically smallest rotation of that sequence. Mirroring reverses the vertex
+            order, which pairs each angle with the edge that came before it instead.
+        """
+        if allow_mirrored not in self._cached_signatures:
+            angles, ratios = self.get_angles_and_edge_ratios()
+            q_angles = [math.floor(a / SIGNATURE_ANGLE_QUANTUM + _SIGNATURE_OFFSET) for a in angles]
+            q_ratios = [math.floor(r / SIGNATURE_RATIO_QUANTUM + _SIGNATURE_OFFSET) for r in ratios]
+            n = len(q_angles)
+
+            res = Polygon._min_rotation([(q_angles[i], q_ratios[i]) for i in range(n)])
+            if allow_mirrored:
+                mirrored = [(q_angles[-i], q_ratios[-i - 1]) for i in range(n)]
+                res = min(res, Polygon._min_rotation(mirrored))
+            self._cached_signatures[allow_mirrored] = res
+        return self._cached_signatures[allow_mirrored]
 
-        if not utils.circular_lists_equal(my_lengths, other_lengths, thresh=const.THRESH):
-            if not allow_mirrored or not utils.circular_lists_equal(my_lengths, list(reversed(other_lengths)), thresh=const.THRESH):
-                return False
+    @staticmethod
+    def _min_rotation(seq) -> tuple:
+        if len(seq) == 0:
+            return ()
+        return min(tuple(seq[i:] + seq[:i]) for i in range(len(seq)))
 
-        return True
+    def is_equivalent_by_angles_and_edge_ratios(self, other, allow_mirrored=True):
+        return self.get_signature(allow_mirrored=allow_mirrored) == other.get_signature(allow_mirrored=allow_mirrored)
 
     def scale(self, scale, from_center=True) -> 'Polygon':
         if from_center:
@@ -249,13 +515,122 @@ class Polygon:
                 new_bb = fixed_bb
         return Polygon(Polygon._scale_to_new_bounding_box(self.vertices, new_bb))
 
+    def get_bounding_box(self):
+        if self._cached_bounding_box is None:
+            self._cached_bounding_box = utils.bounding_box(self.vertices)
+        return self._cached_bounding_box
+
     def contains_point(self, p):
-        v = pygame.Vector2(1, 0)
-        v.rotate_ip(360 / 7)  # invent a ray and **pray** it doesn't hit a fucking corner
-        v.scale_to_length(1000)  # literally every stackoverflow enthusiast that posts python
-        ray = Edge(p, utils.add(p, v))  # code to check polygon point containment fucks this up
-        return sum((1 if ray.intersects(e) else 0) for e in self.edges) % 2 == 1
+        """Whether p is strictly inside the polygon. Points on (or within THRESH of) its boundary are not."""
+        x, y = p
+        bx, by, bw, bh = self.get_bounding_box()
+        if not (bx < x < bx + bw and by < y < by + bh):
+            return False
+
+        # crossing test with a horizontal ray. each edge counts if exactly one of its endpoints is strictly
+        # below the ray, so vertices the ray passes through are counted once (or twice) and never ambiguously.
+        inside = False
+        x1, y1 = self.vertices[-1]
+        for (x2, y2) in self.vertices:
+            dx = x2 - x1
+            dy = y2 - y1
+            if (abs(dx * (y - y1) - dy * (x - x1)) <= const.THRESH * (abs(dx) + abs(dy))
+                    and min(x1, x2) - const.THRESH <= x <= max(x1, x2) + const.THRESH
+                    and min(y1, y2) - const.THRESH <= y <= max(y1, y2) + const.THRESH):
+                return False  # on the boundary
+            if (y1 > y) != (y2 > y) and x1 + (y - y1) * dx / dy > x:
+                inside = not inside
+            x1, y1 = x2, y2
+        return inside
+
+    def contains_points(self, points) -> typing.List[bool]:
+        """Batch version of contains_point."""
+        points = list(points)
+        if np is None or len(points) < BATCH_MIN_SIZE:
+            return [self.contains_point(p) for p in points]
+
+        x, y = np.asarray(points, dtype=float).reshape(-1, 2).T
+        bx, by, bw, bh = self.get_bounding_box()
+        res = (bx < x) & (x < bx + bw) & (by < y) & (y < by + bh)
+
+        inside = np.zeros(len(points), dtype=bool)
+        x1, y1 = self.vertices[-1]
+        for (x2, y2) in self.vertices:
+            dx = x2 - x1
+            dy = y2 - y1
+            res &= ~((np.abs(dx * (y - y1) - dy * (x - x1)) <= const.THRESH * (abs(dx) + abs(dy)))
+                     & (min(x1, x2) - const.THRESH <= x) & (x <= max(x1, x2) + const.THRESH)
+                     & (min(y1, y2) - const.THRESH <= y) & (y <= max(y1, y2) + const.THRESH))
+            if dy != 0:
+                inside ^= ((y1 > y) != (y2 > y)) & (x1 + (y - y1) * dx / dy > x)
+            x1, y1 = x2, y2
+        return (res & inside).tolist()
 
     def __repr__(self):
         return f"{type(self).__name__}(n={len(self.vertices)}, vertices={self.vertices}, angles={self.get_angles()})"
 
+
+class ShapeIndex:
+    """Dict from polygons to values, where polygons with the same signature (see Polygon.get_signature) are
+        treated as the same key. Iterates in insertion order, like a dict.
+    """
+
+    def __init__(self, polygons=(), allow_mirrored=True):
+        self.allow_mirrored = allow_mirrored
+        self._items = {}  # signature -> (polygon, value)
+        self.add_all(polygons)
+
+    def _key(self, polygon: Polygon):
+        return polygon.get_signature(allow_mirrored=self.allow_mirrored)
+
+    def add(self, polygon: Polygon, value=None) -> bool:
+        """returns: True if the polygon was added, False if an equivalent one was already present (and kept)."""
+        key = self._key(polygon)
+        if key in self._items:
+            return False
+        self._items[key] = (polygon, value)
+        return True
+
+    def add_all(self, polygons: typing.Iterable[Polygon]):
+        for p in polygons:
+            self.add(p)
+
+    def get(self, polygon: Polygon, default=None):
+        item = self._items.get(self._key(polygon))
+        return item[1] if item is not None else default
+
+    def setdefault(self, polygon: Polygon, default=None):
+        return self._items.setdefault(self._key(polygon), (polygon, default))[1]
+
+    def items(self) -> typing.List[typing.Tuple[Polygon, typing.Any]]:
+        return list(self._items.values())
+
+    def __getitem__(self, polygon: Polygon):
+        return self._items[self._key(polygon)][1]
+
+    def __setitem__(self, polygon: Polygon, value):
+        key = self._key(polygon)
+        self._items[key] = (self._items[key][0] if key in self._items else polygon, value)
+
+    def pop(self, polygon: Polygon, default=None):
+        item = self._items.pop(self._key(polygon), None)
+        return item[1] if item is not None else default
+
+    def popitem(self) -> typing.Tuple[Polygon, typing.Any]:
+        """returns: the most recently added (polygon, value) pair, after removing it."""
+        return self._items.popitem()[1]
+
+    def clear(self):
+        self._items.clear()
+
+    def __contains__(self, polygon: Polygon):
+        return self._key(polygon) in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter([p for (p, _) in self._items.values()])
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={len(self)})"
@@ -2,11 +2,33 @@ import pygame
 import typing
 import random
 import time
-
+import queue
+import threading
+import weakref
+import os
+import json
+import hashlib
+
+import const
 import src.geometry as geometry
 import src.gameplay as gameplay
+import src.topology as topology
 import src.utils as utils
 
+CACHE_DIR = "cache"  # in the user data dir, for files that are generated at runtime and can be deleted
+
+
+def cache_path(name: str, key: dict) -> typing.Optional[str]:
+    """returns: path of the cache file for the given name and key (which must be json-serializable), or None if
+        there's nowhere to save it.
+    """
+    data_dir = utils.user_data_dir(const.NAME_OF_GAME)
+    if data_dir is None:
+        return None
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(data_dir, CACHE_DIR, f"{name}_{digest[:16]}.json")
+
+
 class PolygonGoal:
 
     def __init__(self, polygon: geometry.Polygon):
@@ -48,82 +70,434 @@ class PolygonGoal:
 
 class GoalGenerator:
 
-    def __init__(self, board, params: 'GoalGenParams'):
-        self.board = board.copy(exclude_edges=True)
+    def __init__(self, board, params: 'GoalGenParams', use_catalog=False, tune_params=None, verbose=True):
+        self.board = board.copy(exclude_edges=True, share_caches=False)  # so it can run on another thread
 
         self.params = params
-        self.buffer = []
+        self.verbose = verbose  # whether to print misses and subdivision stats
+        self.buffer = geometry.ShapeIndex()  # distinct shapes that are ready to be used as goals
+        key = GoalCatalog.make_key(self.board, params)
+
+        # if enabled, the subdivision params are picked before each attempt, to find shapes quickly. This is the default
+        # without a catalog. A catalog's weights should come from the params it was given, and once it's built, it's
+        # sampled instead of subdividing, so the two don't mix.
+        if tune_params is None:
+            tune_params = not use_catalog and params.sampler == "subdivide"
+        if tune_params and use_catalog:
+            raise ValueError("can't tune the params of a generator that uses a catalog")
+        self.tuner: typing.Optional[ParamTuner] = None
+        if tune_params:
+            tuner_key = GoalCatalog.make_key(self.board, params, tuned=True)
+            self.tuner = ParamTuner.load(tuner_key) or ParamTuner(tuner_key)
+
+        # if enabled, goals are sampled from a catalog of the shapes this generator can make. If it isn't cached
+        # on disk yet, it's built from the first GoalCatalog.BUILD_ATTEMPTS subdivisions, then saved.
+        self.catalog: typing.Optional[GoalCatalog] = None
+        self._catalog_in_progress: typing.Optional[GoalCatalog] = None
+        if use_catalog:
+            self.catalog = GoalCatalog.load(key)
+            if self.catalog is None:
+                self._catalog_in_progress = GoalCatalog(key)
+
+    def is_building_catalog(self):
+        return self._catalog_in_progress is not None
 
     def gen_next_goal(self, temp_banned_shapes=(), max_tries=float('inf')) -> PolygonGoal:
+        temp_banned = geometry.ShapeIndex(temp_banned_shapes)
 
         def accepts_poly(p):
-            return self.params.accepts(p) and \
-                    not any(p.is_equivalent_by_angles_and_edge_ratios(s) for s in temp_banned_shapes)
+            return self.params.accepts(p) and p not in temp_banned
+
+        if self.catalog is not None:
+            poly = self.catalog.sample(accepts_poly)
+            return PolygonGoal(poly) if poly is not None else None
 
-        self.buffer = [p for p in self.buffer if accepts_poly(p)]
+        for p in [p for p in self.buffer if not accepts_poly(p)]:
+            self.buffer.pop(p)
 
         cnt = 0
         while len(self.buffer) == 0:
             if cnt > max_tries:
-                print(f"WARN: failed to find a valid goal after {cnt} tries")
+                if self.verbose:
+                    print(f"WARN: failed to find a valid goal after {cnt} tries")
                 break
             cnt += 1
-            self.board.clear_user_edges(force=True)
-            PolygonGoalFactory.subdivide_board(self.board, self.params)
-
-            polys = [p.normalize() for p in self.board.calc_polygons()]
+            if self.params.sampler == "walk":
+                poly = PolygonGoalFactory.random_walk_polygon(self.board, self.params, accepts=accepts_poly)
+                polys = [poly.normalize()] if poly is not None else []
+            else:
+                arm = None
+                if self.tuner is not None:
+                    arm = self.tuner.choose()
+                if arm is not None:
+                    self.params.small_edge_bias, self.params.pcnt_edges_to_try = arm
+                start_time = time.perf_counter()
+
+                self.board.clear_user_edges(force=True)
+                PolygonGoalFactory.subdivide_board(self.board, self.params, verbose=self.verbose)
+                polys = [p.normalize() for p in self.board.calc_polygons()]
+
+                if arm is not None:
+                    accepted = [p for p in polys if self.params.accepts(p)]
+                    self.tuner.record(arm, accepted, 1000 * (time.perf_counter() - start_time))
             for p in polys:
                 if accepts_poly(p):
-                    self.buffer.append(p)
+                    self.buffer.add(p)
+
+            if self._catalog_in_progress is not None:
+                self._catalog_in_progress.record([p for p in polys if self.params.accepts(p)])
+                if self._catalog_in_progress.n_attempts >= GoalCatalog.BUILD_ATTEMPTS:
+                    self.catalog = self._catalog_in_progress
+                    self._catalog_in_progress = None
+                    self.catalog.save()
 
         if len(self.buffer) > 0:
-            return PolygonGoal(self.buffer.pop())
+            return PolygonGoal(self.buffer.popitem()[0])
         else:
             return None
 
+class GoalCatalog:
+    """The distinct shapes a GoalGenerator's board and params can produce, weighted by how often random subdivision
+        produces them. Catalogs are cached on disk, keyed by the pegs and params.
+    """
+
+    VERSION = 1
+    BUILD_ATTEMPTS = 1000  # subdivisions to run when building a catalog
+
+    def __init__(self, key: dict):
+        self.key = key
+        self.shapes = geometry.ShapeIndex()  # normalized polygon -> weight
+        self.n_attempts = 0
+
+    @staticmethod
+    def make_key(board, params: 'GoalGenParams', tuned=False) -> dict:
+        """tuned: whether the subdivision params are picked by a ParamTuner (so they aren't part of the key)."""
+        def finite_or_none(val):
+            return None if val == float('inf') else val
+        return {
+            "version": GoalCatalog.VERSION,
+            "pegs": sorted((round(x, 6), round(y, 6)) for (x, y) in board.pegs),
+            "sampler": params.sampler,
+            "small_edge_bias": params.small_edge_bias if not tuned else "tuned",
+            "pcnt_edges_to_try": params.pcnt_edges_to_try if not tuned else "tuned",
+            "min_n_vertices": finite_or_none(params.min_n_vertices),
+            "max_n_vertices": finite_or_none(params.max_n_vertices),
+            "banned": sorted(p.get_signature() for p in params.banned_polys),
+        }
+
+    @staticmethod
+    def path_for(key: dict) -> typing.Optional[str]:
+        return cache_path(f"goals_v{GoalCatalog.VERSION}", key)
+
+    def record(self, polygons: typing.Iterable[geometry.Polygon]):
+        """Adds the (normalized, acceptable) polygons from one subdivision attempt."""
+        self.n_attempts += 1
+        for p in polygons:
+            self.shapes[p] = self.shapes.get(p, 0) + 1
+
+    def sample(self, accepts: typing.Callable[[geometry.Polygon], bool]) -> typing.Optional[geometry.Polygon]:
+        """returns: a random shape that's accepted, or None if there aren't any."""
+        options = [(p, w) for (p, w) in self.shapes.items() if accepts(p)]
+        if len(options) == 0:
+            return None
+        return random.choices([p for (p, _) in options], weights=[w for (_, w) in options])[0]
+
+    def save(self):
+        path = GoalCatalog.path_for(self.key)
+        if path is None:
+            return
+        data = {
+            "key": self.key,
+            "n_attempts": self.n_attempts,
+            "shapes": [{"vertices": [list(v) for v in p.vertices], "weight": w} for (p, w) in self.shapes.items()]
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+            print(f"INFO: saved goal catalog with {len(self.shapes)} shapes to {path}")
+        except OSError as e:
+            print(f"WARN: failed to save goal catalog to {path}: {e}")
+
+    @staticmethod
+    def load(key: dict) -> typing.Optional['GoalCatalog']:
+        """returns: the cached catalog for the key, or None if there isn't a (valid) one."""
+        path = GoalCatalog.path_for(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data["key"] != json.loads(json.dumps(key)):
+                return None  # hash collision, or an old format
+            res = GoalCatalog(key)
+            res.n_attempts = data["n_attempts"]
+            for shape in data["shapes"]:
+                res.shapes[geometry.Polygon([tuple(v) for v in shape["vertices"]])] = shape["weight"]
+            return res
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"WARN: failed to load goal catalog from {path}: {e}")
+            return None
+
+    def __repr__(self):
+        return f"{type(self).__name__}(shapes={len(self.shapes)}, n_attempts={self.n_attempts})"
+
+
+class ParamTuner:
+    """Epsilon-greedy bandit that picks GoalGenParams' small_edge_bias and pcnt_edges_to_try for each subdivision,
+        to maximize distinct acceptable shapes per millisecond. Shapes are only counted as distinct within an attempt,
+        so the reward doesn't depend on what earlier attempts (or sessions) found, and saved stats stay comparable.
+        Its stats are per generator key (so, per level), and are saved to disk every SAVE_EVERY attempts.
+    """
+
+    VERSION = 3
+    SMALL_EDGE_BIASES = (0.25, 0.5, 0.75)
+    PCNTS_EDGES_TO_TRY = (0.1, 0.2, 0.3)
+    EPSILON = 0.1  # how often to try a random arm, instead of the best one
+    SAVE_EVERY = 100
+
+    def __init__(self, key: dict):
+        self.key = key
+        self.arms = [(b, p) for b in ParamTuner.SMALL_EDGE_BIASES for p in ParamTuner.PCNTS_EDGES_TO_TRY]
+        self.stats = {arm: [0, 0, 0.0] for arm in self.arms}  # arm -> [attempts, distinct shapes, millis]
+        self._unsaved = 0
+
+    def rate(self, arm) -> float:
+        """returns: distinct shapes per millisecond for the arm so far, or inf if it hasn't been tried."""
+        attempts, distinct_shapes, millis = self.stats[arm]
+        return distinct_shapes / millis if attempts > 0 and millis > 0 else float('inf')
+
+    def best_arm(self) -> typing.Tuple[float, float]:
+        return max(self.arms, key=self.rate)
+
+    def choose(self) -> typing.Tuple[float, float]:
+        if random.random() < ParamTuner.EPSILON:
+            return random.choice(self.arms)
+        return self.best_arm()
+
+    def record(self, arm, accepted: typing.Iterable[geometry.Polygon], millis):
+        """accepted: the (normalized) acceptable shapes that an attempt with the arm found"""
+        stats = self.stats[arm]
+        stats[0] += 1
+        stats[1] += len(geometry.ShapeIndex(accepted))
+        stats[2] += millis
+        self._unsaved += 1
+        if self._unsaved >= ParamTuner.SAVE_EVERY:
+            self.save()
+
+    def save(self):
+        self._unsaved = 0
+        path = cache_path(f"tuning_v{ParamTuner.VERSION}", self.key)
+        if path is None:
+            return
+        data = {
+            "key": self.key,
+            "arms": [{"small_edge_bias": b, "pcnt_edges_to_try": p, "attempts": s[0], "distinct_shapes": s[1],
+                      "millis": s[2]} for ((b, p), s) in self.stats.items()]
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"WARN: failed to save param tuning to {path}: {e}")
+
+    @staticmethod
+    def load(key: dict) -> typing.Optional['ParamTuner']:
+        """returns: the saved tuner for the key, or None if there isn't a (valid) one."""
+        path = cache_path(f"tuning_v{ParamTuner.VERSION}", key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data["key"] != json.loads(json.dumps(key)):
+                return None
+            res = ParamTuner(key)
+            for arm in data["arms"]:
+                arm_key = (arm["small_edge_bias"], arm["pcnt_edges_to_try"])
+                if arm_key in res.stats:
+                    res.stats[arm_key] = [arm["attempts"], arm["distinct_shapes"], arm["millis"]]
+            return res
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"WARN: failed to load param tuning from {path}: {e}")
+            return None
+
+    def __repr__(self):
+        b, p = self.best_arm()
+        return f"{type(self).__name__}(best=(small_edge_bias={b}, pcnt_edges_to_try={p}), rate={self.rate((b, p)):.3f})"
+
+
+class GoalWorker:
+    """Runs a GoalGenerator on a background thread, keeping a bounded queue of goals ready to be used.
+
+        The thread stops when the worker is stopped or garbage collected.
+    """
+
+    MAX_QUEUED = 8
+    IDLE_WAIT = 0.05  # seconds to wait after a catalog has no acceptable shapes, instead of spinning on it
+
+    def __init__(self, generator: GoalGenerator, max_queued=MAX_QUEUED):
+        generator.verbose = False  # misses are expected here, and would flood stdout from the thread
+        self.queue = queue.Queue(maxsize=max_queued)
+        self._stop_event = threading.Event()
+
+        # the thread doesn't reference the worker, so the worker can be collected (and stop the thread)
+        self._thread = threading.Thread(target=GoalWorker._run, args=(generator, self.queue, self._stop_event),
+                                        name="GoalWorker", daemon=True)
+        weakref.finalize(self, self._stop_event.set)
+        self._thread.start()
+
+    @staticmethod
+    def _run(generator: GoalGenerator, goal_queue: queue.Queue, stop_event: threading.Event):
+        while not stop_event.is_set():
+            goal = generator.gen_next_goal(max_tries=1)
+            if goal is None and generator.catalog is not None:
+                stop_event.wait(GoalWorker.IDLE_WAIT)  # sampling it again right away won't help
+            while goal is not None and not stop_event.is_set():
+                building = generator.is_building_catalog()
+                try:
+                    goal_queue.put(goal, block=not building, timeout=0.1)
+                    break
+                except queue.Full:
+                    if building:
+                        break  # drop it and keep going, so the catalog gets finished
+
+    def pop_goals(self, n, temp_banned_shapes=()) -> typing.List[PolygonGoal]:
+        """returns: up to n queued goals, none of which match a temp-banned shape (or each other).
+            Goals that do are discarded, the worker will make more.
+        """
+        taken = geometry.ShapeIndex(temp_banned_shapes)
+        res = []
+        while len(res) < n:
+            try:
+                goal = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if taken.add(goal.polygon):
+                res.append(goal)
+        return res
+
+    def stop(self):
+        self._stop_event.set()
+
+
 class GoalGenParams:
 
+    SAMPLERS = ("subdivide", "walk")  # see PolygonGoalFactory.subdivide_board and random_walk_polygon
+
     def __init__(self):
+        self.sampler = "subdivide"
         self.small_edge_bias = 0.5
         self.pcnt_edges_to_try = 0.2
         self.max_n_vertices = float('inf')
         self.min_n_vertices = 3
-        self.banned_polys = []
+        self.banned_polys = geometry.ShapeIndex()
 
     def accepts(self, polygon) -> bool:
         if not (self.min_n_vertices <= len(polygon.get_angles()) <= self.max_n_vertices):
             return False
-        if any(p.is_equivalent_by_angles_and_edge_ratios(polygon) for p in self.banned_polys):
+        if polygon in self.banned_polys:
             return False
         return True
 
 class PolygonGoalFactory:
 
+    _CANDIDATES = {}  # BoardTopology -> candidate edge ids for subdivide_board, grouped by length (shortest first)
+
+    WALK_MAX_VERTICES = 8  # for random_walk_polygon, if the params don't have a max
+    WALK_LENGTH_POWER = 2  # random_walk_polygon picks the next peg with weight 1 / (distance ** this)
+
     @staticmethod
-    def subdivide_board(board, params: GoalGenParams):
-        all_nodes = list(board.all_nodes())
+    def random_walk_polygon(board, params: GoalGenParams, accepts=None) -> typing.Optional[geometry.Polygon]:
+        """Grows a single simple polygon by walking randomly between pegs, picking a number of vertices within the
+            params' bounds up front. Every step keeps the path simple (with exact lattice checks), and the last one
+            must be able to close it into an accepted shape, so banned shapes don't cost a whole walk.
+            accepts: shape filter for the closing step, defaults to params.accepts.
+            returns: the polygon in board space, or None if the walk got stuck.
+        """
+        if board.lattice is None:
+            raise ValueError("board needs lattice coordinates")
+        min_n = max(3, params.min_n_vertices)
+        max_n = min(params.max_n_vertices, PolygonGoalFactory.WALK_MAX_VERTICES)
+        if min_n > max_n:
+            return None
+        n_vertices = random.randint(min_n, int(max_n))
+
+        accepts = params.accepts if accepts is None else accepts
+        pegs = board.topology.peg_list
+        coords = [board.lattice[p] for p in pegs]
+
+        path = [random.randrange(len(pegs))]
+        segs = []  # (coords[path[i]], coords[path[i + 1]])
+        while True:
+            last = coords[path[-1]]
+            options = [v for v in range(len(pegs))
+                       if v not in path and geometry.lattice_path_can_extend(coords, path, segs, v)]
+            weights = [utils.dist(pegs[path[-1]], pegs[v]) ** -PolygonGoalFactory.WALK_LENGTH_POWER for v in options]
+            if len(path) < n_vertices - 1:
+                if len(options) == 0:
+                    return None
+                v = random.choices(options, weights=weights)[0]
+                segs.append((last, coords[v]))
+                path.append(v)
+                continue
+
+            # closing step: try options in weighted random order until one closes into an accepted shape
+            while len(options) > 0:
+                pick = random.choices(range(len(options)), weights=weights)[0]
+                v = options.pop(pick)
+                weights.pop(pick)
+                path.append(v)
+                segs.append((last, coords[v]))
+                if geometry.lattice_path_can_close(coords, path, segs):
+                    poly = geometry.Polygon([pegs[i] for i in path])
+                    if accepts(poly):
+                        return poly
+                segs.pop()
+                path.pop()
+            return None
 
-        all_possible_edges = []
-        for i in range(0, len(all_nodes) - 1):
-            for j in range(i + 1, len(all_nodes)):
-                if not board.is_outer_node(all_nodes[i]) or not board.is_outer_node(all_nodes[j]):
-                    all_possible_edges.append(gameplay.Edge(all_nodes[i], all_nodes[j]))
+    @staticmethod
+    def _candidates_by_length(board) -> typing.List[typing.List[int]]:
+        topo = board.topology
+        if topo not in PolygonGoalFactory._CANDIDATES:
+            by_length = {}
+            for eid, edge in enumerate(topo.candidates):
+                if not board.is_outer_node(edge.p1) or not board.is_outer_node(edge.p2):
+                    length = round(edge.length(), 6)  # so equal lengths don't differ by rounding error
+                    by_length.setdefault(length, []).append(eid)
+            PolygonGoalFactory._CANDIDATES[topo] = [by_length[length] for length in sorted(by_length)]
+        return PolygonGoalFactory._CANDIDATES[topo]
+
+    @staticmethod
+    def subdivide_board(board, params: GoalGenParams, verbose=True):
+        topo = board.topology
 
-        random.shuffle(all_possible_edges)
-        all_possible_edges.sort(key=lambda e: e.length())
+        # sorted by length, in random order among equal lengths, then lightly shuffled
+        all_possible_edges = []
+        for group in PolygonGoalFactory._candidates_by_length(board):
+            all_possible_edges.extend(random.sample(group, len(group)))
         all_possible_edges = utils.lightly_shuffle(all_possible_edges, strength=(1 - params.small_edge_bias))
 
         n_to_try = int(params.pcnt_edges_to_try * len(all_possible_edges))
         failed = 0
 
+        # mask of candidates that can't be added anymore, updated as edges are added
+        blocked = topo.blocked_by(board.user_mask, board.outer_mask)
+
         for i in range(n_to_try):
-            edge = all_possible_edges[i]
-            if board.can_add_user_edge(edge):
-                board.add_user_edge(edge)
+            eid = all_possible_edges[i]
+            if (blocked >> eid) & 1 == 0:
+                board.add_user_edge(topo.candidates[eid])
+                for j in topology.iter_bits(topo.part_masks[eid]):
+                    blocked |= topo.block_masks[j]
             else:
                 failed += 1
 
-        if n_to_try > 0:
+        if verbose and n_to_try > 0:
             print(f"INFO: added {(n_to_try-failed)}/{n_to_try} edges ({100*(n_to_try-failed)/n_to_try:.2f}%) of {len(all_possible_edges)} possible edges.")
 
         return board
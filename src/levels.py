@@ -3,7 +3,7 @@ import src.geometry as geometry
 
 class Level:
 
-    def __init__(self, style, decay_rate=0.03, boost_rate=0.5, base_cure_time=10, max_temp_cure_boost=1.5, min_vertices=4, max_vertices=float('inf'), slab_req=15, banned_polys=()):
+    def __init__(self, style, decay_rate=0.03, boost_rate=0.5, base_cure_time=10, max_temp_cure_boost=1.5, min_vertices=4, max_vertices=float('inf'), slab_req=15, banned_polys=(), goal_sampler="subdivide"):
         self.style = style
         self.decay_rate = decay_rate  # percent max per second
         self.base_cure_time = base_cure_time  # sec
@@ -13,6 +13,7 @@ class Level:
         self.max_vertices = max_vertices
         self.slab_req = slab_req
         self.banned_polys = banned_polys
+        self.goal_sampler = goal_sampler  # see goals.GoalGenParams.SAMPLERS
 
 
 # square grid (declare ccw)
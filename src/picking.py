@@ -0,0 +1,72 @@
+import typing
+
+import pygame
+
+import src.utils as utils
+
+
+class PickBuffer:
+    """Screen-space maps from pixel to the nearest peg (and nearest edge) within a radius.
+
+        Each map is a surface whose mapped pixel value is (index + 1) into the list of pegs (or edges) it was built
+        from, and 0 where nothing is in range. Shapes are drawn at every radius from largest to smallest, so at each
+        pixel the one drawn last (i.e. the nearest) wins. Lookups are then a single get_at_mapped call.
+    """
+
+    def __init__(self, rect, radius: int):
+        self.radius = radius
+        self.rect = [int(v) for v in utils.rect_expand(rect, all_sides=radius)]  # screen area covered
+
+        self._pegs = []
+        self._peg_map = pygame.Surface(self.rect[2:], depth=32)
+        self._pegs_key = None
+
+        self._edges = []
+        self._edge_map = pygame.Surface(self.rect[2:], depth=32)
+        self._edges_key = None
+
+    def _to_local(self, screen_xy):
+        return (screen_xy[0] - self.rect[0], screen_xy[1] - self.rect[1])
+
+    def update_pegs(self, pegs, key, to_screen: typing.Callable):
+        """Rebuilds the peg map, unless it was already built with the same key."""
+        if key == self._pegs_key:
+            return
+        self._pegs_key = key
+        self._pegs = list(pegs)
+
+        pts = [self._to_local(to_screen(p)) for p in self._pegs]
+        self._peg_map.fill(0)
+        for r in range(self.radius, 0, -1):
+            for idx, pt in enumerate(pts):
+                pygame.draw.circle(self._peg_map, idx + 1, pt, r)
+
+    def update_edges(self, edges, key, to_screen: typing.Callable):
+        """Rebuilds the edge map, unless it was already built with the same key."""
+        if key == self._edges_key:
+            return
+        self._edges_key = key
+        self._edges = list(edges)
+
+        segs = [(self._to_local(to_screen(e.p1)), self._to_local(to_screen(e.p2))) for e in self._edges]
+        self._edge_map.fill(0)
+        for r in range(self.radius, 0, -1):
+            for idx, (p1, p2) in enumerate(segs):
+                pygame.draw.line(self._edge_map, idx + 1, p1, p2, width=2 * r + 1)
+                pygame.draw.circle(self._edge_map, idx + 1, p1, r)
+                pygame.draw.circle(self._edge_map, idx + 1, p2, r)
+
+    def _lookup(self, surf, items, screen_xy):
+        if screen_xy is None:
+            return None
+        x, y = self._to_local(screen_xy)
+        if 0 <= x < self.rect[2] and 0 <= y < self.rect[3]:
+            idx = surf.get_at_mapped((int(x), int(y)))
+            return items[idx - 1] if 0 < idx <= len(items) else None
+        return None
+
+    def peg_at(self, screen_xy):
+        return self._lookup(self._peg_map, self._pegs, screen_xy)
+
+    def edge_at(self, screen_xy):
+        return self._lookup(self._edge_map, self._edges, screen_xy)
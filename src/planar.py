@@ -0,0 +1,165 @@
+import bisect
+import math
+
+
+class PlanarFaces:
+    """Half-edge face structure for a planar straight-line graph.
+
+        Every undirected edge (n1, n2) is stored as two half-edges, (n1, n2) and (n2, n1). Each node keeps its
+        neighbors sorted by angle, and the half-edge that follows (a, b) around a face is (b, c), where c is the
+        neighbor of b that comes right after a in that ordering. Following those links partitions the half-edges
+        into closed boundary walks ("cycles"), one per face boundary.
+
+        Adding or removing an edge only changes the successor of two half-edges, so only the (at most two) cycles
+        passing through them are re-traced. Everything else stays as it was.
+    """
+
+    def __init__(self):
+        self._neighbors = {}  # node -> list of neighbors, sorted by angle
+        self._angles = {}     # node -> list of angles, parallel to self._neighbors[node]
+        self._cycle_of = {}   # half-edge (n1, n2) -> cycle id
+        self._cycles = {}     # cycle id -> list of nodes in the walk (the half-edges are consecutive pairs)
+        self._next_id = 0
+
+    def copy(self) -> 'PlanarFaces':
+        res = PlanarFaces()
+        res._neighbors = {n: list(l) for (n, l) in self._neighbors.items()}
+        res._angles = {n: list(l) for (n, l) in self._angles.items()}
+        res._cycle_of = dict(self._cycle_of)
+        res._cycles = dict(self._cycles)  # cycle lists are never mutated after tracing
+        res._next_id = self._next_id
+        return res
+
+    def cycles(self):
+        """returns: dict of cycle id -> list of nodes. Don't mutate it."""
+        return self._cycles
+
+    def has_edge(self, n1, n2):
+        return (n1, n2) in self._cycle_of
+
+    def add_edge(self, n1, n2):
+        """Adds an edge, which must not cross (or duplicate) any existing edge.
+            returns: (ids of cycles that no longer exist, ids of new cycles)
+        """
+        if n1 == n2 or self.has_edge(n1, n2):
+            return (), ()
+
+        # the half-edges whose successors are about to change
+        touched = []
+        for (a, b) in ((n1, n2), (n2, n1)):
+            if a in self._neighbors:
+                idx = bisect.bisect(self._angles[a], self._angle(a, b))
+                touched.append((self._neighbors[a][idx - 1], a))
+
+        removed = {self._cycle_of[h] for h in touched}
+        for cid in removed:
+            del self._cycles[cid]
+
+        self._insert_neighbor(n1, n2)
+        self._insert_neighbor(n2, n1)
+
+        # every half-edge of the removed cycles now lies on a cycle through one of the new half-edges
+        added = []
+        for h in ((n1, n2), (n2, n1)):
+            if self._cycle_of.get(h) not in added:
+                added.append(self._trace(h))
+
+        return tuple(removed), tuple(added)
+
+    def remove_edge(self, n1, n2):
+        """returns: (ids of cycles that no longer exist, ids of new cycles)"""
+        if not self.has_edge(n1, n2):
+            return (), ()
+
+        removed = {self._cycle_of[(n1, n2)], self._cycle_of[(n2, n1)]}
+        leftover = []
+        for cid in removed:
+            path = self._cycles.pop(cid)
+            for i in range(len(path)):
+                leftover.append((path[i], path[(i + 1) % len(path)]))
+
+        del self._cycle_of[(n1, n2)]
+        del self._cycle_of[(n2, n1)]
+        self._remove_neighbor(n1, n2)
+        self._remove_neighbor(n2, n1)
+
+        added = []
+        for h in leftover:
+            if h in self._cycle_of and self._cycle_of[h] in removed:
+                added.append(self._trace(h))
+
+        return tuple(removed), tuple(added)
+
+    @staticmethod
+    def _angle(origin, pt):
+        return math.atan2(pt[1] - origin[1], pt[0] - origin[0])
+
+    def _insert_neighbor(self, node, n):
+        if node not in self._neighbors:
+            self._neighbors[node] = []
+            self._angles[node] = []
+        ang = PlanarFaces._angle(node, n)
+        idx = bisect.bisect(self._angles[node], ang)
+        self._angles[node].insert(idx, ang)
+        self._neighbors[node].insert(idx, n)
+
+    def _remove_neighbor(self, node, n):
+        idx = self._neighbors[node].index(n)
+        if len(self._neighbors[node]) == 1:
+            del self._neighbors[node]
+            del self._angles[node]
+        else:
+            self._neighbors[node].pop(idx)
+            self._angles[node].pop(idx)
+
+    def _next(self, half_edge):
+        a, b = half_edge
+        neighbors = self._neighbors[b]
+        return b, neighbors[(neighbors.index(a) + 1) % len(neighbors)]
+
+    def _trace(self, start) -> int:
+        cid = self._next_id
+        self._next_id += 1
+
+        path = []
+        h = start
+        while True:
+            path.append(h[0])
+            self._cycle_of[h] = cid
+            h = self._next(h)
+            if h == start:
+                break
+
+        self._cycles[cid] = path
+        return cid
+
+
+def split_loops(path) -> list:
+    """Splits a closed walk into simple closed walks, at every node it passes through more than once.
+        returns: list of the walks (as lists of nodes)
+    """
+    res = []
+    stack = []
+    index_of = {}  # node -> index in stack
+    for n in path:
+        if n in index_of:
+            i = index_of[n]
+            res.append(stack[i:])
+            for m in stack[i + 1:]:
+                del index_of[m]
+            del stack[i + 1:]
+        else:
+            index_of[n] = len(stack)
+            stack.append(n)
+    res.append(stack)
+    return res
+
+
+def signed_area(path) -> float:
+    """Shoelace area of a closed walk. Positive if it winds clockwise on screen (y-down)."""
+    total = 0
+    for i in range(len(path)):
+        x1, y1 = path[i - 1]
+        x2, y2 = path[i]
+        total += x1 * y2 - x2 * y1
+    return total / 2
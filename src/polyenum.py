@@ -0,0 +1,126 @@
+import argparse
+import collections
+import concurrent.futures
+import time
+import typing
+
+import src.geometry as geometry
+import src.gameplay as gameplay
+import src.goals as goals
+import src.levels as levels
+
+# Enumerates every distinct shape that can be made as a region on a board. Run from the project root with:
+#   python -m src.polyenum [--max-vertices N] [--workers N]
+#
+# Any simple polygon whose vertices are pegs can be a region (by drawing its edges, and nothing inside it), so this
+# walks over all of them, using the board's lattice coordinates so that every geometry check is exact.
+
+DEFAULT_MAX_VERTICES = 5  # for levels that allow any number of vertices
+
+
+def _enumerate_from(args) -> typing.Dict[tuple, typing.Tuple[int, ...]]:
+    """Finds the simple polygons whose lowest-indexed vertex is pegs[start], with no flat vertices.
+        returns: signature -> peg indices of one polygon with that shape
+    """
+    pegs, coords, start, max_vertices = args
+    n = len(coords)
+    shapes = {}
+    seen_offsets = set()  # translated copies of a polygon have the same shape, so only check one of them
+
+    path = [start]
+    segs = []  # (coords[path[i]], coords[path[i + 1]])
+    used = [False] * n
+    used[start] = True
+    s = coords[start]
+
+    def try_close():
+        if not geometry.lattice_path_can_close(coords, path, segs):
+            return
+        offsets = tuple((coords[i][0] - s[0], coords[i][1] - s[1]) for i in path)
+        if offsets in seen_offsets:
+            return
+        seen_offsets.add(offsets)
+        sig = geometry.Polygon([pegs[i] for i in path]).get_signature()
+        if sig not in shapes:
+            shapes[sig] = tuple(path)
+
+    def extend():
+        last = coords[path[-1]]
+        for v in range(start + 1, n):
+            if used[v] or not geometry.lattice_path_can_extend(coords, path, segs, v):
+                continue
+
+            path.append(v)
+            segs.append((last, coords[v]))
+            used[v] = True
+            if len(path) >= 3 and path[1] < v:  # each polygon is found in both directions, only keep one
+                try_close()
+            if len(path) < max_vertices:
+                extend()
+            used[v] = False
+            segs.pop()
+            path.pop()
+
+    extend()
+    return shapes
+
+
+def enumerate_shapes(board: 'gameplay.Board', max_vertices, workers=None) -> geometry.ShapeIndex:
+    """returns: ShapeIndex of every distinct region shape with at most max_vertices (nonflat) vertices. The values
+        are the number of vertices.
+    """
+    if board.lattice is None:
+        raise ValueError("board needs lattice coordinates")
+    pegs = sorted(board.pegs)
+    coords = [board.lattice[p] for p in pegs]
+    tasks = [(pegs, coords, start, max_vertices) for start in range(len(pegs))]
+
+    if workers == 1:
+        results = map(_enumerate_from, tasks)
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_enumerate_from, tasks)
+
+    res = geometry.ShapeIndex()
+    try:
+        for shapes in results:
+            for path in shapes.values():
+                res.add(geometry.Polygon([pegs[i] for i in path]).normalize(), len(path))
+    finally:
+        if workers != 1:
+            executor.shutdown()
+    return res
+
+
+def level_params(level: levels.Level, board: 'gameplay.Board') -> goals.GoalGenParams:
+    params = goals.GoalGenParams()
+    params.banned_polys.add(board.calc_polygons()[0])
+    params.banned_polys.add_all(level.banned_polys)
+    params.min_n_vertices = level.min_vertices
+    params.max_n_vertices = level.max_vertices
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Counts the distinct region shapes for each level.")
+    parser.add_argument("--max-vertices", type=int, default=DEFAULT_MAX_VERTICES,
+                        help=f"vertex cap for levels that don't have one (default {DEFAULT_MAX_VERTICES})")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per cpu)")
+    args = parser.parse_args()
+
+    cache = {}  # (style, cap) -> ShapeIndex
+    for idx, level in enumerate(levels.LEVELS):
+        board = gameplay.Board.new_board(*level.style)
+        cap = level.max_vertices if level.max_vertices != float('inf') else args.max_vertices
+        key = (level.style, cap)
+        if key not in cache:
+            start_time = time.time()
+            cache[key] = enumerate_shapes(board, cap, workers=args.workers)
+            print(f"INFO: enumerated {level.style} up to {cap} vertices in {time.time() - start_time:.1f}s")
+
+        params = level_params(level, board)
+        accepted = [n for (p, n) in cache[key].items() if params.accepts(p)]
+        histogram = collections.Counter(accepted)
+        capped = " (capped)" if level.max_vertices == float('inf') else ""
+        print(f"level {idx:>2} {str(level.style):<16} {len(accepted):>6} goal shapes of {len(cache[key])} "
+              f"with <= {cap} vertices{capped}: " + ", ".join(f"{k}v={histogram[k]}" for k in sorted(histogram)))
@@ -33,6 +33,11 @@ class SceneManager:
     def do_quit(self):
         self.should_quit = True
 
+    def shutdown(self):
+        for scene in (self.active_scene, self._next_scene):
+            if scene is not None:
+                scene.on_discard()
+
 
 class Scene:
 
@@ -49,6 +54,10 @@ class Scene:
     def on_exit(self):
         pass
 
+    def on_discard(self):
+        """called when the scene is abandoned for good (not just exited), so it can release its resources."""
+        pass
+
     def update(self, dt):
         self.elapsed_time += dt
 
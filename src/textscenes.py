@@ -38,6 +38,10 @@ class BasicTextScene(scenes.Scene):
     def update_underlay(self, dt):
         self.underlay.update(dt, fake=True)
 
+    def on_discard(self):
+        if self.underlay is not None:
+            self.underlay.on_discard()
+
     def apply_fader(self, surf, rect='full', alpha='default', color='default'):
         rect = surf.get_rect() if rect == 'full' else rect
         alpha = ALPHA if alpha == 'default' else alpha
@@ -176,6 +180,10 @@ class NextLevelScene(BasicTextScene):
         self.prev_scene = prev_scene
         self.next_scene = next_scene
 
+    def on_discard(self):
+        self.prev_scene.on_discard()
+        self.next_scene.on_discard()
+
     def apply_fader(self, surf, rect='full', alpha='default', color='default'):
         alpha = min(255, max(0, int(255 * (1 - 2 * abs(0.5 - min(1.0, (self.elapsed_time / NextLevelScene.DELAY)))))))
         super().apply_fader(surf, rect=rect, alpha=alpha, color=color)
@@ -227,6 +235,7 @@ class GameOverScene(BasicTextScene):
         if self.elapsed_time > GameOverScene.DELAY:
             if const.clicked_or_any_pressed_this_frame():
                 sounds.play_sound("select")
+                self.underlay.on_discard()
                 self.manager.jump_to_scene(MainMenuScene())
 
 
@@ -267,4 +276,5 @@ class YouWinScene(BasicTextScene):
         if self.elapsed_time > GameOverScene.DELAY:
             if const.clicked_or_any_pressed_this_frame():
                 sounds.play_sound("select")
+                self.underlay.on_discard()
                 self.manager.jump_to_scene(MainMenuScene())
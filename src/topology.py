@@ -0,0 +1,146 @@
+import typing
+
+import src.geometry as geometry
+from src.geometry import Edge
+
+Point = typing.Tuple[float, float]
+
+
+def iter_bits(mask: int) -> typing.Iterator[int]:
+    """yields: the index of each set bit in mask, lowest first"""
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+class BoardTopology:
+    """Lookup tables that only depend on a board's pegs, built once per peg set and shared between boards."""
+
+    _CACHE = {}  # frozenset of pegs -> BoardTopology
+
+    def __init__(self, pegs: typing.Iterable[Point], lattice: typing.Dict[Point, typing.Tuple[int, int]] = None):
+        self.pegs = frozenset(pegs)
+        self.peg_list = list(self.pegs)
+        self.peg_array = geometry.np.array(self.peg_list, dtype=float) if geometry.np is not None else None
+
+        # (p1, p2) -> the edges from p1 to p2 after splitting it at every peg in between, for every pair of pegs
+        self.splits: typing.Dict[typing.Tuple[Point, Point], typing.Tuple[Edge, ...]] = {}
+
+        # every pair of pegs is a candidate edge, and gets an id (the same for both orderings of its endpoints).
+        # sets of candidates are stored as int bitmasks, with bit (1 << id) set for each member.
+        self.candidates: typing.List[Edge] = []
+        self.edge_ids: typing.Dict[typing.Tuple[Point, Point], int] = {}
+
+        self.part_masks: typing.List[int] = []       # id -> mask of the candidates it splits into
+        self.conflicts: typing.List[int] = []        # id -> mask of the candidates it intersects
+        self.split_conflicts: typing.List[int] = []  # id -> mask of the candidates its split parts intersect
+
+        self.containing: typing.List[int] = []       # id -> mask of the candidates that split into it (or are it)
+        self.block_masks: typing.List[int] = []      # id -> mask of the candidates it blocks, once it's an edge
+
+        # one Edge per ordered pair of pegs, shared by every table below
+        edge_objs = {(p1, p2): Edge(p1, p2) for p1 in self.peg_list for p2 in self.peg_list if p1 != p2}
+
+        lattice_to_peg = {ij: xy for (xy, ij) in lattice.items()} if lattice is not None else None
+        peg_list = self.peg_list
+        for p1 in peg_list:
+            for p2 in peg_list:
+                if p1 == p2:
+                    continue
+                if lattice_to_peg is not None:
+                    between = [lattice_to_peg[ij] for ij in geometry.lattice_points_between(lattice[p1], lattice[p2])
+                               if ij in lattice_to_peg]
+                else:
+                    edge = edge_objs[(p1, p2)]
+                    between = [pt for pt in peg_list if edge.contains_point(pt, including_endpoints=False)]
+                    between.sort(key=lambda pt: (pt[0] - p1[0]) ** 2 + (pt[1] - p1[1]) ** 2)
+                pts = [p1] + between + [p2]
+                self.splits[(p1, p2)] = tuple(edge_objs[(pts[i], pts[i + 1])] for i in range(len(pts) - 1))
+
+                if (p2, p1) not in self.edge_ids:
+                    self.edge_ids[(p1, p2)] = self.edge_ids[(p2, p1)] = len(self.candidates)
+                    self.candidates.append(edge_objs[(p1, p2)])
+
+        for edge in self.candidates:
+            mask = 0
+            for part in self.splits[(edge.p1, edge.p2)]:
+                mask |= 1 << self.edge_ids[(part.p1, part.p2)]
+            self.part_masks.append(mask)
+
+        self._calc_conflicts(lattice)
+        self._calc_block_masks()
+
+    def _calc_conflicts(self, lattice):
+        n = len(self.candidates)
+        conflicts = [0] * n
+        if lattice is not None:
+            segs = [(lattice[e.p1], lattice[e.p2]) for e in self.candidates]
+            intersects = geometry.lattice_segments_intersect
+        else:
+            segs = [(e.p1, e.p2) for e in self.candidates]
+
+            def intersects(a, b, c, d):
+                return Edge(a, b).intersects(Edge(c, d))
+
+        boxes = [(min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])) for (a, b) in segs]
+        for i in range(n):
+            a, b = segs[i]
+            min_x, min_y, max_x, max_y = boxes[i]
+            for j in range(i + 1, n):
+                box = boxes[j]
+                if box[0] > max_x or box[2] < min_x or box[1] > max_y or box[3] < min_y:
+                    continue
+                c, d = segs[j]
+                if intersects(a, b, c, d):
+                    conflicts[i] |= 1 << j
+                    conflicts[j] |= 1 << i
+        self.conflicts = conflicts
+
+        for i in range(n):
+            mask = 0
+            for j in iter_bits(self.part_masks[i]):
+                mask |= conflicts[j]
+            self.split_conflicts.append(mask)
+
+    def _calc_block_masks(self):
+        # a candidate can't be added (with splitting) if one of its parts is already an edge, or crosses one. So an
+        # edge blocks every candidate containing it, or containing something that crosses it.
+        n = len(self.candidates)
+        containing = [0] * n
+        for i in range(n):
+            for j in iter_bits(self.part_masks[i]):
+                containing[j] |= 1 << i
+        self.containing = containing
+
+        for j in range(n):
+            mask = containing[j]
+            for k in iter_bits(self.conflicts[j]):
+                mask |= containing[k]
+            self.block_masks.append(mask)
+
+    def edge_id(self, edge: Edge) -> typing.Optional[int]:
+        return self.edge_ids.get((edge.p1, edge.p2))
+
+    def edges_in_mask(self, mask: int) -> typing.List[Edge]:
+        return [self.candidates[i] for i in iter_bits(mask)]
+
+    def blocked_by(self, user_mask: int, outer_mask: int) -> int:
+        """returns: mask of the candidates that can't be added (with splitting) to a board with these edges."""
+        res = 0
+        for j in iter_bits(outer_mask):
+            res |= self.containing[j]  # nothing crosses the outer edges, but they can't be overlapped
+        for j in iter_bits(user_mask):
+            res |= self.block_masks[j]
+        return res
+
+    @staticmethod
+    def get(pegs: typing.Iterable[Point], lattice=None) -> 'BoardTopology':
+        key = frozenset(pegs)
+        if key not in BoardTopology._CACHE:
+            BoardTopology._CACHE[key] = BoardTopology(key, lattice=lattice)
+        return BoardTopology._CACHE[key]
+
+    def split(self, edge: Edge) -> typing.Optional[typing.Tuple[Edge, ...]]:
+        """returns: the edge split at every peg it passes through, or None if either endpoint isn't a peg."""
+        return self.splits.get((edge.p1, edge.p2))
@@ -1,5 +1,6 @@
 import random
 import typing
+import collections
 
 import pygame
 import pygame._sdl2 as sdl2
@@ -263,6 +264,40 @@ def line_line_intersection(xy1, xy2, xy3, xy4):
             p_y_numerator / denominator)
 
 
+# 2D versions of the above that take unpacked coordinates and don't build any intermediate tuples. They're
+# called from the innermost loops of geometry.Edge, where the generic versions' allocations add up.
+
+def dist_xy(x1, y1, x2, y2):
+    return math.hypot(x2 - x1, y2 - y1)
+
+
+def dist_to_segment_xy(px, py, ax, ay, bx, by):
+    """returns: the distance from point p to the segment from a to b."""
+    abx = bx - ax
+    aby = by - ay
+    len2 = abx * abx + aby * aby
+    if len2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = (px - ax) * abx + (py - ay) * aby
+    if t <= 0:
+        return math.hypot(px - ax, py - ay)
+    elif t >= len2:
+        return math.hypot(px - bx, py - by)
+    else:
+        return abs(abx * (py - ay) - aby * (px - ax)) / math.sqrt(len2)
+
+
+def line_line_intersection_xy(x1, y1, x2, y2, x3, y3, x4, y4):
+    """returns: the intersection of the (infinite) lines through 1-2 and 3-4, or None if they're parallel."""
+    denominator = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    if denominator == 0:
+        return None
+    det12 = x1 * y2 - y1 * x2
+    det34 = x3 * y4 - y3 * x4
+    return ((det12 * (x3 - x4) - (x1 - x2) * det34) / denominator,
+            (det12 * (y3 - y4) - (y1 - y2) * det34) / denominator)
+
+
 def projection(v1, v2):
     """finds the vector projection of v1 onto v2, or None if it doesn't exist"""
     v2_mag = mag(v2)
@@ -316,6 +351,51 @@ def circular_lists_equal(l1, l2, thresh=0):
             return True
     return False
 
+class LRUCache:
+    """A dict-like cache that holds at most max_size items, evicting the least recently used ones first."""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        else:
+            self.misses += 1
+            return default
+
+    def put(self, key, val):
+        self._data[key] = val
+        self._data.move_to_end(key)
+        self._evict()
+
+    def set_max_size(self, max_size):
+        self.max_size = max_size
+        self._evict()
+
+    def _evict(self):
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={len(self)}/{self.max_size}, hits={self.hits}, misses={self.misses})"
+
+
 def lightly_shuffle(items: typing.List[T], strength=0.25) -> typing.List[T]:
     """
     :param items: list of items to shuffle
@@ -405,3 +485,31 @@ def res_path(filepath):
         base_path = os.path.abspath(".")
 
     return os.path.join(base_path, filepath)
+
+
+_USER_DATA_DIRS = {}  # app name -> path, or None if it isn't writable
+
+
+def user_data_dir(app_name) -> typing.Optional[str]:
+    """returns: a user-writable directory for files that are saved between runs (unlike res_path, which can be a
+        temp folder in an exe), or None if there isn't one.
+    """
+    if app_name not in _USER_DATA_DIRS:
+        if sys.platform == "win32":
+            base_path = os.environ.get("APPDATA") or os.path.expanduser("~\\AppData\\Roaming")
+        elif sys.platform == "darwin":
+            base_path = os.path.expanduser("~/Library/Application Support")
+        else:
+            base_path = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+        path = os.path.join(base_path, app_name)
+        try:
+            if not os.path.isabs(path):
+                raise OSError("no home directory")
+            os.makedirs(path, exist_ok=True)
+            if not os.access(path, os.W_OK):
+                raise OSError("not writable")
+        except OSError as e:
+            print(f"WARN: can't save data to {path}, so nothing will be kept between runs: {e}")
+            path = None
+        _USER_DATA_DIRS[app_name] = path
+    return _USER_DATA_DIRS[app_name]